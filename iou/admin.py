@@ -1,11 +1,11 @@
 from __future__ import absolute_import, unicode_literals, division
 
 from django.contrib import admin
-from iou.models import ExpenceProfile, Expence
+from iou.models import ExpenceProfile, Expence, LedgerEntry
 
 
 class ExpenceAdmin(admin.ModelAdmin):
-    list_display = ('payer', 'amount', 'comment')
+    list_display = ('created_time', 'payer', 'amount', 'comment')
     list_select_related = ('payer',)
 
 
@@ -13,5 +13,21 @@ class ExpenceProfileAdmin(admin.ModelAdmin):
     pass
 
 
+class LedgerEntryAdmin(admin.ModelAdmin):
+    # The ledger is append-only.
+    list_display = ('time', 'expence_id', 'profile', 'amount')
+    list_select_related = ('profile',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(Expence, ExpenceAdmin)
 admin.site.register(ExpenceProfile, ExpenceProfileAdmin)
+admin.site.register(LedgerEntry, LedgerEntryAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class IouConfig(AppConfig):
     name = 'iou'
+
+    def ready(self):
+        from iou import signals  # noqa: F401
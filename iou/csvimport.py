@@ -0,0 +1,143 @@
+# vim: set fileencoding=utf8:
+"""Bulk import of Expences from CSV.
+
+Each row has the columns payer, amount, consumers and comment, e.g.
+
+    payer,amount,consumers,comment
+    KASS,123.50,KASS;FORM;INKA,Julefrokost
+
+The payer and consumers are display names of profiles as shown on the
+site, case insensitive, and the consumers are separated by semicolons.
+The amount may use a decimal comma. A first row with the column names
+is skipped.
+
+The rows are checked with parse_expences, which reports every error at
+once, and then saved by import_expences with a few bulk INSERTs in one
+transaction.
+"""
+from __future__ import absolute_import, unicode_literals, division
+
+import csv
+import collections
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from kasse.names import get_profile_names
+from iou.models import Expence, post_expences
+
+
+EXPENCE_CSV_COLUMNS = ('payer', 'amount', 'consumers', 'comment')
+
+ExpenceRow = collections.namedtuple(
+    'ExpenceRow', 'payer_id amount consumer_ids comment')
+
+
+def normalize_name(name):
+    """
+    >>> normalize_name('  FORM   Mathias ')
+    'form mathias'
+    """
+    return ' '.join(name.split()).casefold()
+
+
+def get_profile_lookup(association=None):
+    """Return {normalized display name: [profile id]} of the profiles
+    that are not anonymous, optionally only those in the association.
+
+    More than one profile may have the same display name."""
+    association_id = getattr(association, 'pk', None)
+    lookup = {}
+    for profile_id, n in get_profile_names().items():
+        if n.is_anonymous:
+            continue
+        if association_id is not None and n.association_id != association_id:
+            continue
+        lookup.setdefault(normalize_name(n.name), []).append(profile_id)
+    return lookup
+
+
+def parse_expences(lines, lookup):
+    """Return an ExpenceRow for each CSV row in lines.
+
+    Profile names are looked up in the result of get_profile_lookup.
+    Raises ValidationError with a message for each invalid row.
+    """
+    amount_field = Expence._meta.get_field('amount').formfield()
+    rows = []
+    errors = []
+
+    def get_profile_id(name):
+        profile_ids = lookup.get(normalize_name(name), [])
+        if len(profile_ids) > 1:
+            raise ValidationError('Flere personer hedder "%s"' % name.strip())
+        elif not profile_ids:
+            raise ValidationError('Ukendt person "%s"' % name.strip())
+        return profile_ids[0]
+
+    reader = csv.reader(lines)
+    for line_number, row in enumerate(reader, 1):
+        if not any(v.strip() for v in row):
+            continue
+        if (line_number == 1 and
+                tuple(v.strip().lower() for v in row) == EXPENCE_CSV_COLUMNS):
+            continue
+        try:
+            if len(row) not in (3, 4):
+                raise ValidationError(
+                    'Forventede 3 eller 4 kolonner men fik %d' % len(row))
+            payer, amount, consumers = row[:3]
+            comment = row[3].strip() if len(row) == 4 else ''
+            payer_id = get_profile_id(payer)
+            amount = amount_field.clean(amount.strip().replace(',', '.'))
+            consumer_ids = [get_profile_id(name)
+                            for name in consumers.split(';') if name.strip()]
+            if not consumer_ids:
+                raise ValidationError('Ingen forbrugere')
+            if len(set(consumer_ids)) != len(consumer_ids):
+                raise ValidationError('Samme forbruger flere gange')
+        except ValidationError as e:
+            errors.extend('Linje %d: %s' % (reader.line_num, m)
+                          for m in e.messages)
+            continue
+        rows.append(ExpenceRow(payer_id, amount, consumer_ids, comment))
+    if errors:
+        raise ValidationError(errors)
+    return rows
+
+
+def insert_expences(expences):
+    """Insert the Expences with as few queries as the database allows
+    and set their primary keys. Must be called in a transaction."""
+    if connection.features.can_return_ids_from_bulk_insert:
+        Expence.raw_objects.bulk_create(expences)
+    elif connection.vendor == 'sqlite':
+        # The first INSERT locks the database for writing until the end
+        # of the transaction, so the newest Expences are the ones inserted.
+        Expence.raw_objects.bulk_create(expences)
+        qs = Expence.raw_objects.order_by('-pk')[:len(expences)]
+        pks = sorted(qs.values_list('pk', flat=True))
+        for expence, pk in zip(expences, pks):
+            expence.pk = pk
+    else:
+        # Concurrent INSERTs may interleave their primary keys.
+        for expence in expences:
+            expence.save()
+
+
+def import_expences(rows):
+    """Save an Expence for each ExpenceRow and post them to the ledger
+    in one transaction. Return the new Expences."""
+    expences = [
+        Expence(payer_id=r.payer_id, amount=r.amount, comment=r.comment)
+        for r in rows]
+    with transaction.atomic():
+        insert_expences(expences)
+        through = Expence.consumers.through
+        through.objects.bulk_create([
+            through(expence_id=e.pk, profile_id=profile_id)
+            for e, r in zip(expences, rows)
+            for profile_id in r.consumer_ids])
+        # bulk_create does not send the signals that post to the ledger.
+        post_expences([e.pk for e in expences])
+    return expences
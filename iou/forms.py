@@ -1,10 +1,14 @@
 # vim: set fileencoding=utf8:
 from __future__ import absolute_import, unicode_literals, division
 
+import datetime
+
 from django import forms
+from django.utils import timezone
 
 from kasse.templatetags.kasse_extras import display_profile
 from iou.models import Expence
+from iou.csvimport import get_profile_lookup, parse_expences
 
 
 class ExpenceCreateForm(forms.ModelForm):
@@ -35,3 +39,47 @@ class ExpenceCreateForm(forms.ModelForm):
     class Meta:
         model = Expence
         fields = ['payer', 'consumers', 'amount', 'comment']
+
+
+class ExpenceFilterForm(forms.Form):
+    start_date = forms.DateField(
+        required=False, label='Fra',
+        widget=forms.DateInput(attrs={'type': 'date'}, format='%Y-%m-%d'))
+    end_date = forms.DateField(
+        required=False, label='Til',
+        widget=forms.DateInput(attrs={'type': 'date'}, format='%Y-%m-%d'))
+
+    def filter(self, qs):
+        """Return the Expences in qs created on or between the dates.
+
+        The dates are converted to a range of created_time, so the
+        database can use an index on created_time.
+        """
+        start_date = self.cleaned_data['start_date']
+        end_date = self.cleaned_data['end_date']
+        if start_date:
+            qs = qs.filter(created_time__gte=timezone.make_aware(
+                datetime.datetime.combine(start_date, datetime.time())))
+        if end_date:
+            end_date += datetime.timedelta(days=1)
+            qs = qs.filter(created_time__lt=timezone.make_aware(
+                datetime.datetime.combine(end_date, datetime.time())))
+        return qs
+
+
+class ExpenceImportForm(forms.Form):
+    file = forms.FileField(label='CSV-fil')
+
+    def __init__(self, association=None, **kwargs):
+        super(ExpenceImportForm, self).__init__(**kwargs)
+        self.association = association
+
+    def clean_file(self):
+        """Return the ExpenceRows of the uploaded file."""
+        f = self.cleaned_data['file']
+        try:
+            s = f.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise forms.ValidationError('Filen skal være i UTF-8')
+        lookup = get_profile_lookup(self.association)
+        return parse_expences(s.splitlines(), lookup)
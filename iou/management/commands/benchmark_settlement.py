@@ -0,0 +1,89 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import math
+import time
+import random
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from kasse.models import Association
+from iou.settlement import settle, get_balances
+
+
+def check_settlement(balances, transfers):
+    """Raise CommandError unless the transfers bring the balances to zero,
+    except for the difference of balances that do not sum to zero."""
+    remaining = dict(balances)
+    for t in transfers:
+        if t.amount <= 0:
+            raise CommandError('Transfer of a nonpositive amount: %s' % (t,))
+        remaining[t.debtor] += t.amount
+        remaining[t.creditor] -= t.amount
+    if any(b < 0 for b in remaining.values()) and any(
+            b > 0 for b in remaining.values()):
+        raise CommandError('Balances of both signs are left unsettled')
+    if len(transfers) >= max(len(balances), 1):
+        raise CommandError('%d transfers for %d balances' %
+                           (len(transfers), len(balances)))
+
+
+class Command(BaseCommand):
+    help = ('Time the settlement of IOU balances on a synthetic dataset ' +
+            'and on random balances. All changes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--associations', type=int, default=2)
+        parser.add_argument('--profiles', type=int, default=5000)
+        parser.add_argument('--expences', type=int, default=200000)
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+            help='Numbers of random balances to settle')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        with transaction.atomic():
+            call_command(
+                'generate_kasse_data', associations=options['associations'],
+                profiles=options['profiles'], expences=options['expences'],
+                timetrials=0, images=0, posts=0, seed=options['seed'],
+                verbosity=options['verbosity'])
+            self.stdout.write('Settlement of %d profiles on %s' % (
+                options['profiles'], connection.vendor))
+            for association in [None] + list(Association.objects.all()):
+                self.benchmark_association(association)
+            transaction.set_rollback(True)
+
+        rng = random.Random(options['seed'])
+        for n in options['sizes']:
+            balances = [(i, Decimal(rng.randrange(-100000, 100000)) / 100)
+                        for i in range(n - 1)]
+            balances.append((n - 1, -sum(b for i, b in balances)))
+            transfers, t = self.time(settle, balances)
+            check_settlement(balances, transfers)
+            self.stdout.write(
+                '%7d random balances %8.3f s %7d transfers '
+                '%6.2f µs per n log n' % (
+                    n, t, len(transfers), 1e6 * t / (n * math.log2(n))))
+
+    def time(self, fn, *args):
+        times = []
+        for i in range(self.repeat):
+            t = time.perf_counter()
+            result = fn(*args)
+            times.append(time.perf_counter() - t)
+        return result, min(times)
+
+    def benchmark_association(self, association):
+        balances, load_time = self.time(get_balances, association)
+        transfers, settle_time = self.time(settle, balances)
+        check_settlement(balances, transfers)
+        self.stdout.write(
+            '%-20s %6d balances %7d transfers  load %.3f s  settle %.3f s' % (
+                association or 'All', len(balances), len(transfers),
+                load_time, settle_time))
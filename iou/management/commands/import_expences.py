@@ -0,0 +1,46 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from kasse.models import Association
+from iou.csvimport import (
+    get_profile_lookup, parse_expences, import_expences,
+)
+
+
+class Command(BaseCommand):
+    help = ('Import Expences from a CSV file with the columns payer, ' +
+            'amount, consumers and comment. See iou.csvimport.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('filename')
+        parser.add_argument(
+            '--association',
+            help='Only look up the names of profiles in this association')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Check the file without importing it')
+
+    def handle(self, *args, **options):
+        association = None
+        if options['association']:
+            try:
+                association = Association.objects.get(
+                    name=options['association'])
+            except Association.DoesNotExist:
+                raise CommandError(
+                    'No association named %r' % options['association'])
+        lookup = get_profile_lookup(association)
+        with open(options['filename'], encoding='utf-8-sig',
+                  newline='') as fp:
+            try:
+                rows = parse_expences(fp, lookup)
+            except ValidationError as e:
+                raise CommandError('\n'.join(e.messages))
+        if options['dry_run']:
+            self.stdout.write('%d expences can be imported' % len(rows))
+            return
+        expences = import_expences(rows)
+        self.stdout.write('Imported %d expences' % len(expences))
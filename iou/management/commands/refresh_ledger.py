@@ -0,0 +1,94 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from iou.models import (
+    Expence, LedgerEntry, ProfileBalance, get_missing_entries, round_amount,
+)
+
+
+class Command(BaseCommand):
+    help = ('Add the LedgerEntries missing for the current Expences ' +
+            'and recompute the ProfileBalances from the entries.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report data that is out of date')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.verify = options['verify']
+        self.quiet = options['verbosity'] == 0
+        self.verbose = options['verbosity'] >= 2 or self.verify
+        self.batch_size = options['batch_size']
+        errors = []
+        errors += self.refresh_entries()
+        errors += self.refresh_balances()
+        if errors:
+            raise CommandError('\n'.join(errors))
+        if self.verify:
+            self.stdout.write('Everything is up to date')
+
+    def refresh_entries(self):
+        # Include deleted Expences, whose entries must sum to zero.
+        expence_ids = set(Expence._base_manager.values_list('pk', flat=True))
+        expence_ids.update(LedgerEntry.objects.order_by().values_list(
+            'expence_id', flat=True).distinct())
+        expence_ids = sorted(expence_ids)
+        missing = []
+        for i in range(0, len(expence_ids), self.batch_size):
+            missing += get_missing_entries(
+                expence_ids[i:i + self.batch_size])
+        if self.verbose:
+            for entry in missing:
+                self.stdout.write('Missing LedgerEntry %s' % (entry,))
+
+        if self.verify:
+            if missing:
+                return ['%d LedgerEntry row(s) are missing' % len(missing)]
+            return []
+
+        LedgerEntry.objects.bulk_create(missing, batch_size=self.batch_size)
+        if not self.quiet:
+            self.stdout.write('Created %d LedgerEntry row(s)' % len(missing))
+        return []
+
+    def refresh_balances(self):
+        qs = LedgerEntry.objects.order_by().values_list('profile_id')
+        expected = {profile_id: round_amount(balance)
+                    for profile_id, balance in qs.annotate(s=Sum('amount'))}
+        existing = dict(ProfileBalance.objects.values_list(
+            'profile_id', 'balance'))
+        stale = [ProfileBalance(profile_id=profile_id, balance=balance)
+                 for profile_id, balance in sorted(expected.items())
+                 if existing.get(profile_id) != balance]
+        # Balances of profiles without entries must be zero.
+        stale += [ProfileBalance(profile_id=profile_id, balance=0)
+                  for profile_id, balance in sorted(existing.items())
+                  if profile_id not in expected and balance]
+        if self.verbose:
+            for b in stale:
+                self.stdout.write('ProfileBalance %s != %s' % (
+                    b, existing.get(b.profile_id)))
+
+        if self.verify:
+            if stale:
+                return ['%d ProfileBalance row(s) are out of date' %
+                        len(stale)]
+            return []
+
+        with transaction.atomic():
+            ProfileBalance.objects.bulk_create(
+                [b for b in stale if b.profile_id not in existing],
+                batch_size=self.batch_size)
+            ProfileBalance.objects.bulk_update(
+                [b for b in stale if b.profile_id in existing], ['balance'],
+                batch_size=self.batch_size)
+        if not self.quiet:
+            self.stdout.write(
+                'Updated %d ProfileBalance row(s)' % len(stale))
+        return []
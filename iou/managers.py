@@ -1,23 +1,46 @@
 # vim: set fileencoding=utf8:
 from __future__ import absolute_import, unicode_literals, division
 
+from django.apps import apps
 from django.db import models
-from django.db.models import Count, Sum, F, ExpressionWrapper
+from django.db.models import Count, F, Func, Value
+from django.db.models.functions import Coalesce
 
 from kasse.managers import ProfileManager as ProfileManagerBase
 
 
+class DecimalDivision(Func):
+    """Divide two numbers without rounding to an integer.
+
+    SQLite stores decimals without a fractional part as integers
+    and divides them as integers, so divide as REAL there.
+    """
+
+    arg_joiner = ' / '
+    template = '(%(expressions)s)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        numerator, denominator = self.get_source_expressions()
+        numerator_sql, numerator_params = compiler.compile(numerator)
+        denominator_sql, denominator_params = compiler.compile(denominator)
+        sql = '(CAST(%s AS REAL) / %s)' % (numerator_sql, denominator_sql)
+        return sql, list(numerator_params) + list(denominator_params)
+
+
+def annotate_balance(qs):
+    """Annotate a Profile queryset with balance, the amount paid minus
+    the share of each expence consumed, from iou.models.ProfileBalance."""
+    amount_field = apps.get_model('iou', 'Expence')._meta.get_field('amount')
+    return qs.annotate(balance=Coalesce(
+        'iou_balance__balance', Value(0, output_field=amount_field)))
+
+
 class ProfileManager(ProfileManagerBase):
     use_for_related_fields = True
 
     def get_queryset(self):
         qs = super(ProfileManager, self).get_queryset()
-        # balance = (
-        #     Sum(F('expence_consumed_set__amount') /
-        #         Count('expence_consumed_set__consumers')))
-        # qs = qs.annotate(balance=balance)
-        # print(qs.query)
-        return qs
+        return annotate_balance(qs)
 
 
 class ExpenceManager(models.Manager):
@@ -26,7 +49,7 @@ class ExpenceManager(models.Manager):
     def get_queryset(self):
         qs = super(ExpenceManager, self).get_queryset()
         amount_field = qs.model._meta.get_field('amount')
-        amount_each = ExpressionWrapper(F('amount') / Count('consumers'),
-                                        output_field=amount_field)
+        amount_each = DecimalDivision(F('amount'), Count('consumers'),
+                                      output_field=amount_field)
         qs = qs.annotate(amount_each=amount_each)
         return qs
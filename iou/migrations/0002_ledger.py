@@ -0,0 +1,88 @@
+# Generated by Django 2.2.3 on 2026-10-18 15:18
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Copies of split_amount and get_expence_entries from iou.models as they
+# were when this migration was written.
+
+def split_amount(amount, n):
+    cents = int(amount * 100)
+    share, remainder = divmod(cents, n)
+    return [Decimal(share + (i < remainder)) / 100 for i in range(n)]
+
+
+def get_expence_entries(payer_id, amount, consumer_ids):
+    entries = {}
+    consumer_ids = sorted(consumer_ids)
+    if not consumer_ids:
+        return entries
+    entries[payer_id] = amount
+    for profile_id, share in zip(consumer_ids,
+                                 split_amount(amount, len(consumer_ids))):
+        entries[profile_id] = entries.get(profile_id, 0) - share
+    return entries
+
+
+def post_expences(apps, schema_editor):
+    Expence = apps.get_model('iou', 'Expence')
+    LedgerEntry = apps.get_model('iou', 'LedgerEntry')
+    ProfileBalance = apps.get_model('iou', 'ProfileBalance')
+    consumers = {}
+    qs = Expence.consumers.through.objects.values_list(
+        'expence_id', 'profile_id')
+    for expence_id, profile_id in qs:
+        consumers.setdefault(expence_id, []).append(profile_id)
+    entries = []
+    balances = {}
+    qs = Expence.objects.order_by('pk')
+    qs = qs.values_list('pk', 'payer_id', 'amount')
+    for expence_id, payer_id, amount in qs:
+        expence_entries = get_expence_entries(
+            payer_id, amount, consumers.get(expence_id, []))
+        for profile_id, amount in sorted(expence_entries.items()):
+            if amount:
+                entries.append(LedgerEntry(
+                    expence_id=expence_id, profile_id=profile_id,
+                    amount=amount))
+                balances[profile_id] = balances.get(profile_id, 0) + amount
+    LedgerEntry.objects.bulk_create(entries, batch_size=500)
+    ProfileBalance.objects.bulk_create(
+        [ProfileBalance(profile_id=profile_id, balance=balance)
+         for profile_id, balance in balances.items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kasse', '0012_title_display_title'),
+        ('iou', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileBalance',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='iou_balance', serialize=False, to='kasse.Profile')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expence_id', models.IntegerField(db_index=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=9)),
+                ('time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='kasse.Profile')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+        ),
+        migrations.RunPython(post_expences, migrations.RunPython.noop),
+    ]
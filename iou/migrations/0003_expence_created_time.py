@@ -0,0 +1,34 @@
+# Generated by Django 2.2.3 on 2026-10-18 15:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iou', '0002_ledger'),
+    ]
+
+    operations = [
+        # Add the field without a default first, so the existing
+        # Expences get null instead of the time of the migration.
+        migrations.AddField(
+            model_name='expence',
+            name='created_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='expence',
+            name='created_time',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='expence',
+            index=models.Index(fields=['created_time', 'id'], name='expence_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expence',
+            index=models.Index(fields=['payer', 'created_time', 'id'], name='expence_payer_created_idx'),
+        ),
+    ]
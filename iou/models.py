@@ -1,10 +1,15 @@
 # vim: set fileencoding=utf8:
 from __future__ import absolute_import, unicode_literals, division
 
-from django.db import models
-from django.db.models import Sum, Count, ExpressionWrapper
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
 
 from kasse.models import Profile
+from kasse.utils import on_commit_batch
 
 from iou.managers import ExpenceManager, ProfileManager
 
@@ -25,13 +30,10 @@ class ExpenceProfile(Profile):
         self._balance = v
 
     def compute_balance(self):
-        amount_field = Expence._meta.get_field('amount')
-        exp1 = Sum('amount')
-        exp2 = ExpressionWrapper(exp1 / Count('consumers'),
-                                 output_field=amount_field)
-        a = self.expence_paid_set.all().aggregate(a=exp1)['a'] or 0
-        b = Expence.objects.filter(consumers=self).aggregate(a=Sum('amount_each', output_field=amount_field))['a'] or 0
-        return a - b
+        # Instances from ExpenceProfile.objects already have the balance
+        # annotated by ProfileManager.
+        qs = ExpenceProfile.objects.filter(pk=self.pk)
+        return qs.values_list('balance', flat=True).get()
 
     class Meta:
         proxy = True
@@ -39,15 +41,200 @@ class ExpenceProfile(Profile):
 
 class Expence(models.Model):
     objects = ExpenceManager()
+    raw_objects = models.Manager()
 
     payer = models.ForeignKey(Profile, related_name='expence_paid_set', on_delete=models.CASCADE)
     consumers = models.ManyToManyField(
         Profile, related_name='expence_consumed_set')
     amount = models.DecimalField(max_digits=9, decimal_places=2)
     comment = models.TextField(blank=True)
+    # Null for the Expences created before this field was added.
+    created_time = models.DateTimeField(
+        blank=True, null=True, default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Date filter of ExpenceList
+            models.Index(fields=['created_time', 'id'],
+                         name='expence_created_idx'),
+            # Date filter of ExpenceList in an association
+            models.Index(fields=['payer', 'created_time', 'id'],
+                         name='expence_payer_created_idx'),
+        ]
+
+
+@python_2_unicode_compatible
+class LedgerEntry(models.Model):
+    """A change of the balance of a profile caused by an Expence.
+
+    The ledger is append-only: entries are never changed or deleted.
+    When an Expence is created, the payer is credited the amount and
+    each consumer is debited their share, so the entries of an Expence
+    sum to zero. When the Expence is changed or deleted, entries with the
+    difference are added by post_expences, so the entries of an Expence
+    always sum to its current effect on each profile.
+
+    expence_id is not a foreign key, so the entries of a deleted Expence
+    are kept.
+    """
+
+    expence_id = models.IntegerField(db_index=True)
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=9, decimal_places=2)
+    time = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return '%s: %s %+.2f' % (self.expence_id, self.profile_id,
+                                 self.amount)
+
+    class Meta:
+        ordering = ['pk']
+
+
+@python_2_unicode_compatible
+class ProfileBalance(models.Model):
+    """The sum of the LedgerEntries of a profile.
+
+    Kept up to date by post_expences, so the balance of a profile can be
+    read without summing its expences.
+    """
+
+    profile = models.OneToOneField(
+        Profile, on_delete=models.CASCADE, primary_key=True,
+        related_name='iou_balance')
+    balance = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+
+    def __str__(self):
+        return '%s: %.2f' % (self.profile_id, self.balance)
+
+
+def round_amount(amount):
+    """Round a sum of amounts, which SQLite computes as a float,
+    to two decimal places."""
+    return Decimal(amount).quantize(Decimal('0.01'))
+
+
+def split_amount(amount, n):
+    """Split a decimal amount with two decimal places into n shares
+    that differ by at most 0.01 and sum to exactly the amount.
+
+    The first shares get the extra cents.
+
+    >>> split_amount(Decimal('100.00'), 3)
+    [Decimal('33.34'), Decimal('33.33'), Decimal('33.33')]
+    >>> split_amount(Decimal('-0.05'), 2)
+    [Decimal('-0.02'), Decimal('-0.03')]
+    """
+    cents = int(amount * 100)
+    share, remainder = divmod(cents, n)
+    return [Decimal(share + (i < remainder)) / 100 for i in range(n)]
+
+
+def get_expence_entries(payer_id, amount, consumer_ids):
+    """Return {profile id: amount} of the entries of an Expence.
+
+    Consumers are sorted by id to decide who pays the extra cents.
+    An Expence without consumers does not change any balance.
+    """
+    entries = {}
+    consumer_ids = sorted(consumer_ids)
+    if not consumer_ids:
+        return entries
+    entries[payer_id] = amount
+    for profile_id, share in zip(consumer_ids,
+                                 split_amount(amount, len(consumer_ids))):
+        entries[profile_id] = entries.get(profile_id, 0) - share
+    return entries
+
+
+def get_missing_entries(expence_ids):
+    """Return the (unsaved) LedgerEntries that bring the entries of the
+    given Expences up to date."""
+    expected = {}
+    qs = Expence._base_manager.filter(pk__in=expence_ids)
+    expences = qs.values_list('pk', 'payer_id', 'amount')
+    consumers = {}
+    qs = Expence.consumers.through.objects.filter(expence_id__in=expence_ids)
+    for expence_id, profile_id in qs.values_list('expence_id', 'profile_id'):
+        consumers.setdefault(expence_id, []).append(profile_id)
+    for expence_id, payer_id, amount in expences:
+        expected[expence_id] = get_expence_entries(
+            payer_id, amount, consumers.get(expence_id, []))
+
+    current = {}
+    qs = LedgerEntry.objects.filter(expence_id__in=expence_ids)
+    qs = qs.order_by().values_list('expence_id', 'profile_id')
+    for expence_id, profile_id, amount in qs.annotate(s=Sum('amount')):
+        current.setdefault(expence_id, {})[profile_id] = round_amount(amount)
+
+    now = timezone.now()
+    entries = []
+    for expence_id in sorted(set(expence_ids)):
+        new = expected.get(expence_id, {})
+        old = current.get(expence_id, {})
+        for profile_id in sorted(set(new) | set(old)):
+            amount = new.get(profile_id, 0) - old.get(profile_id, 0)
+            if amount:
+                entries.append(LedgerEntry(
+                    expence_id=expence_id, profile_id=profile_id,
+                    amount=amount, time=now))
+    return entries
+
+
+def post_expences(expence_ids):
+    """Add the LedgerEntries that bring the entries of the given Expences
+    up to date, and update the ProfileBalances.
+
+    The refresh_ledger command does the same for all Expences.
+    """
+    # Look up the Expences in batches to stay below the limit
+    # on the number of query parameters of SQLite.
+    expence_ids = sorted(set(expence_ids))
+    with transaction.atomic():
+        entries = []
+        for i in range(0, len(expence_ids), 500):
+            entries += get_missing_entries(expence_ids[i:i + 500])
+        LedgerEntry.objects.bulk_create(entries)
+        deltas = {}
+        for entry in entries:
+            deltas[entry.profile_id] = (
+                deltas.get(entry.profile_id, 0) + entry.amount)
+        add_to_balances(deltas)
+
+
+def add_to_balances(deltas):
+    """Add {profile id: amount} to the ProfileBalances."""
+    deltas = sorted((p, a) for p, a in deltas.items() if a)
+    ProfileBalance.objects.bulk_create(
+        [ProfileBalance(profile_id=profile_id) for profile_id, a in deltas],
+        ignore_conflicts=True)
+    for profile_id, amount in deltas:
+        ProfileBalance.objects.filter(profile_id=profile_id).update(
+            balance=F('balance') + amount)
+
+
+def post_expences_on_commit(expence_ids):
+    """Call post_expences when the current transaction commits.
+
+    An Expence and its consumers are saved separately, so posting them
+    at once makes the entries of a new Expence sum to zero.
+    """
+    on_commit_batch('post_expences', expence_ids, post_expences)
 
 
 def move_profile(target, destination):
-    Expence.objects.filter(payer=target).update(payer=destination)
+    """Move the Expences of target to destination.
+
+    The ledger is append-only, so the entries of target are not moved.
+    Instead, post_expences adds entries that take the effect of the moved
+    Expences off the balance of target and add it to destination.
+    """
+    paid = Expence.raw_objects.filter(payer=target)
+    expence_ids = set(paid.values_list('pk', flat=True))
     consumers = Expence.consumers.through
-    consumers.objects.filter(profile=target).update(profile=destination)
+    consumed = consumers.objects.filter(profile=target)
+    expence_ids.update(consumed.values_list('expence_id', flat=True))
+    with transaction.atomic():
+        paid.update(payer=destination)
+        consumed.update(profile=destination)
+        post_expences(expence_ids)
@@ -0,0 +1,105 @@
+# vim: set fileencoding=utf8:
+"""Settlement of IOU balances with few transfers.
+
+A profile with a negative balance owes money and a profile with a positive
+balance is owed money. settle returns transfers from the former to the
+latter that bring every balance to zero.
+
+Finding the fewest transfers is NP-hard, but any settlement where each
+transfer brings at least one balance to zero needs at most n - 1 transfers
+for n profiles. settle first pairs debtors and creditors with exactly the
+same amount, which saves a transfer each, and then repeatedly lets the
+largest debtor pay the largest creditor, using a heap for each side,
+in O(n log n) time.
+"""
+from __future__ import absolute_import, unicode_literals, division
+
+import collections
+import heapq
+
+from iou.models import ProfileBalance
+
+
+Transfer = collections.namedtuple('Transfer', 'debtor creditor amount')
+
+Settlement = collections.namedtuple('Settlement', 'transfers unsettled')
+
+
+def settle(balances):
+    """Return a list of Transfers that settle the given
+    (profile id, balance) pairs, largest transfer first.
+
+    If the balances do not sum to zero, the difference is left unsettled
+    on some of the profiles on the side with the larger sum.
+
+    >>> from decimal import Decimal as D
+    >>> for t in settle([(1, D(-10)), (2, D(-5)), (3, D(5)), (4, D(10))]):
+    ...     print(t.debtor, t.creditor, t.amount)
+    1 4 10
+    2 3 5
+    >>> for t in settle([(1, D(-30)), (2, D(20)), (3, D(6)), (4, D(4))]):
+    ...     print(t.debtor, t.creditor, t.amount)
+    1 2 20
+    1 3 6
+    1 4 4
+    """
+    transfers = []
+    # Heaps of (-amount, profile id), so the largest amount is first
+    # and ties are broken by profile id.
+    debtors = []
+    creditors = []
+    unmatched = {}
+    for profile_id, balance in balances:
+        if not balance:
+            continue
+        # Pair with a profile of the opposite balance if there is one.
+        other = unmatched.get(-balance)
+        if other:
+            other_id = other.pop()
+            if balance < 0:
+                transfers.append(Transfer(profile_id, other_id, -balance))
+            else:
+                transfers.append(Transfer(other_id, profile_id, balance))
+        else:
+            unmatched.setdefault(balance, []).append(profile_id)
+    for balance, profile_ids in unmatched.items():
+        for profile_id in profile_ids:
+            if balance < 0:
+                debtors.append((balance, profile_id))
+            else:
+                creditors.append((-balance, profile_id))
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    while debtors and creditors:
+        debt, debtor = heapq.heappop(debtors)
+        credit, creditor = heapq.heappop(creditors)
+        amount = min(-debt, -credit)
+        transfers.append(Transfer(debtor, creditor, amount))
+        if debt + amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
+        if credit + amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+    transfers.sort(key=lambda t: (-t.amount, t.debtor, t.creditor))
+    return transfers
+
+
+def get_balances(association=None):
+    """Return (profile id, balance) of the profiles with a nonzero balance,
+    optionally only those in the given association."""
+    qs = ProfileBalance.objects.exclude(balance=0)
+    if association:
+        qs = qs.filter(profile__association=association)
+    return list(qs.order_by('profile_id').values_list('profile_id', 'balance'))
+
+
+def get_settlement(association=None):
+    """Return the Settlement of get_balances(association).
+
+    Expences may be shared across associations, so the balances within an
+    association need not sum to zero. unsettled is their sum: the amount
+    that is owed to (or by, if negative) profiles outside the association.
+    """
+    balances = get_balances(association)
+    unsettled = sum((b for p, b in balances), 0)
+    return Settlement(settle(balances), unsettled)
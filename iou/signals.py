@@ -0,0 +1,28 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from iou.models import Expence, post_expences_on_commit
+
+
+@receiver(post_save, sender=Expence)
+@receiver(post_delete, sender=Expence)
+def expence_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    post_expences_on_commit([instance.pk])
+
+
+@receiver(m2m_changed, sender=Expence.consumers.through)
+def consumers_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # The Expences of a profile were changed.
+        if action == 'pre_clear':
+            post_expences_on_commit(
+                instance.expence_consumed_set.values_list('pk', flat=True))
+        elif action.startswith('post_') and pk_set:
+            post_expences_on_commit(pk_set)
+    elif action.startswith('post_'):
+        post_expences_on_commit([instance.pk])
@@ -3,14 +3,21 @@ from __future__ import absolute_import, unicode_literals, division
 from django.conf.urls import url
 
 from iou.views import (
-    BalanceList, ExpenceCreate, ExpenceList,
+    BalanceList, Settlement, SettlementJson, ExpenceCreate, ExpenceImport,
+    ExpenceList,
 )
 
 urlpatterns = [
     url(r'^balance/$', BalanceList.as_view(),
         name='balance_list'),
+    url(r'^settle/$', Settlement.as_view(),
+        name='settlement'),
+    url(r'^settle/json/$', SettlementJson.as_view(),
+        name='settlement_json'),
     url(r'^create/$', ExpenceCreate.as_view(),
         name='expence_create'),
+    url(r'^import/$', ExpenceImport.as_view(),
+        name='expence_import'),
     url(r'^$', ExpenceList.as_view(),
         name='expence_list'),
 ]
@@ -1,11 +1,25 @@
 # vim: set fileencoding=utf8:
 from __future__ import absolute_import, unicode_literals, division
 
+import json
+import logging
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseRedirect
 from django.urls import reverse
-from django.views.generic import ListView, CreateView
+from django.views.generic import (
+    ListView, CreateView, FormView, TemplateView, View,
+)
 
+from kasse.models import Profile
+from kasse.names import get_profile_names, get_profile_name
+from kasse.views import superuser_required
 from iou.models import Expence, ExpenceProfile
-from iou.forms import ExpenceCreateForm
+from iou.forms import ExpenceCreateForm, ExpenceFilterForm, ExpenceImportForm
+from iou.csvimport import import_expences
+from iou.settlement import get_settlement
+
+logger = logging.getLogger('kasse')
 
 
 class BalanceList(ListView):
@@ -19,6 +33,58 @@ class BalanceList(ListView):
         return sorted(qs, key=lambda p: p.balance)
 
 
+class Settlement(TemplateView):
+    '''Transfers that settle the balances of BalanceList.'''
+
+    template_name = 'iou/settlement.html'
+
+    def get_context_data(self, **kwargs):
+        context_data = super(Settlement, self).get_context_data(**kwargs)
+        settlement = get_settlement(self.request.association)
+        profile_ids = set()
+        for t in settlement.transfers:
+            profile_ids.update((t.debtor, t.creditor))
+        profiles = Profile.objects.in_bulk(profile_ids)
+        context_data['transfer_list'] = [
+            (profiles[t.debtor], profiles[t.creditor], t.amount)
+            for t in settlement.transfers]
+        context_data['unsettled'] = settlement.unsettled
+        return context_data
+
+
+class SettlementJson(View):
+    '''Settlement as JSON.
+
+    Each transfer is {"from": profile id, "to": profile id, "amount"}
+    with the amount as a string of a decimal number. "profiles" contains
+    the name of each profile in a transfer, and "unsettled" is the amount
+    owed to profiles outside the association.
+    '''
+
+    def get(self, request):
+        settlement = get_settlement(request.association)
+        names = get_profile_names()
+        transfers = []
+        profiles = {}
+        missing = set()
+        for t in settlement.transfers:
+            transfers.append(
+                {'from': t.debtor, 'to': t.creditor, 'amount': t.amount})
+            for profile_id in (t.debtor, t.creditor):
+                if profile_id in names:
+                    profiles[profile_id] = names[profile_id].name
+                else:
+                    missing.add(profile_id)
+        # The names of this process may be older than the balances.
+        for profile in Profile.objects.filter(pk__in=missing):
+            profiles[profile.pk] = get_profile_name(profile).name
+        data = {'transfers': transfers, 'profiles': profiles,
+                'unsettled': settlement.unsettled}
+        return HttpResponse(
+            json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')),
+            content_type='application/json')
+
+
 class ExpenceCreate(CreateView):
     template_name = 'iou/expencecreate.html'
     form_class = ExpenceCreateForm
@@ -38,11 +104,50 @@ class ExpenceCreate(CreateView):
         return reverse('balance_list')
 
 
+@superuser_required
+class ExpenceImport(FormView):
+    '''Upload a CSV file of Expences; see iou.csvimport.'''
+
+    template_name = 'iou/expenceimport.html'
+    form_class = ExpenceImportForm
+
+    def get_form_kwargs(self, **kwargs):
+        kwargs = super(ExpenceImport, self).get_form_kwargs(**kwargs)
+        kwargs['association'] = self.request.association
+        return kwargs
+
+    def form_valid(self, form):
+        expences = import_expences(form.cleaned_data['file'])
+        logger.info("%d expences imported by %s",
+                    len(expences), self.request.profile,
+                    extra=self.request.log_data)
+        return HttpResponseRedirect(reverse('expence_list'))
+
+
 class ExpenceList(ListView):
     template_name = 'iou/expencelist.html'
+    paginate_by = 50
+
+    def get_form(self):
+        return ExpenceFilterForm(data=self.request.GET)
 
     def get_queryset(self):
-        qs = Expence.objects.all()
+        # ExpenceManager annotates the number of consumers, which the list
+        # does not need and which would make COUNT(*) of the paginator
+        # group every Expence.
+        qs = Expence.raw_objects.select_related('payer')
+        qs = qs.prefetch_related('consumers')
         if self.request.association:
             qs = qs.filter(payer__association=self.request.association)
-        return qs
+        self.form = self.get_form()
+        if self.form.is_valid():
+            qs = self.form.filter(qs)
+        return qs.order_by('-pk')
+
+    def get_context_data(self, **kwargs):
+        context_data = super(ExpenceList, self).get_context_data(**kwargs)
+        context_data['form'] = self.form
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        context_data['filter_query'] = query.urlencode()
+        return context_data
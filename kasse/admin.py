@@ -2,6 +2,7 @@ from __future__ import absolute_import, unicode_literals, division
 
 from django.contrib import admin
 from kasse.models import Association, Title, Profile, Contest
+from kasse.managers import annotate_display_name
 
 
 class TitleAdmin(admin.ModelAdmin):
@@ -36,6 +37,10 @@ class ProfileAdmin(admin.ModelAdmin):
 
     list_filter = (AnonymousFilter, 'association')
 
+    def get_queryset(self, request):
+        qs = super(ProfileAdmin, self).get_queryset(request)
+        return annotate_display_name(qs)
+
     def get_profile_display(self, o):
         return str(o)
     get_profile_display.short_description = 'Profile'
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class KasseConfig(AppConfig):
     name = 'kasse'
+
+    def ready(self):
+        from kasse import signals  # noqa: F401
@@ -8,6 +8,14 @@ register('awesomplete',
          'kasse/awesomplete.js',
          filters='jsmin', output='gen/awesomplete.js')
 
+register('profileselect',
+         'kasse/profileselect.js',
+         filters='jsmin', output='gen/profileselect.js')
+
+register('loadmore',
+         'kasse/loadmore.js',
+         filters='jsmin', output='gen/loadmore.js')
+
 register('stopwatch',
          'stopwatch/stopwatch.es6',
          'picturefill.js',
@@ -3,28 +3,67 @@ from __future__ import absolute_import, unicode_literals, division
 
 from django.core.exceptions import ValidationError
 from django import forms
+from django.urls import reverse
 from django.utils import six, timezone
 from django.utils.dateparse import parse_duration
 from django.contrib.auth.forms import UserCreationForm as AdminUserCreationForm
 
 from kasse.models import Profile, Association, Contest
+from kasse.names import (
+    get_profile_names_version, get_profile_names, get_profile_name,
+    profile_label,
+)
 from kasse.fields import TKPeriodField, APeriodField
 
 
+class ProfileSelect(forms.Select):
+    """Select of profiles that only renders the selected profile.
+
+    The other profiles are added by kasse/profileselect.js from the
+    versioned ProfileJson index, which the browser may cache.
+    """
+
+    def get_context(self, name, value, attrs):
+        version = get_profile_names_version()
+        attrs = dict(attrs or {})
+        attrs['data-profile-index'] = '%s?v=%s' % (
+            reverse('profile_json'), version)
+        return super(ProfileSelect, self).get_context(name, value, attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        all_choices = self.choices
+        names = get_profile_names()
+        choices = []
+        for v in value:
+            if v in ('', None):
+                continue
+            try:
+                profile_name = names[int(v)]
+            except (KeyError, ValueError):
+                continue
+            choices.append((v, profile_label(profile_name)))
+        empty_label = all_choices.field.empty_label
+        if empty_label is not None:
+            choices.insert(0, ('', empty_label))
+        self.choices = choices
+        try:
+            return super(ProfileSelect, self).optgroups(name, value, attrs)
+        finally:
+            self.choices = all_choices
+
+
 class ProfileModelChoiceField(forms.ModelChoiceField):
+    """Choice of a named profile, validated by pk
+    without reading the other profiles."""
+
+    widget = ProfileSelect
+
     def __init__(self, **kwargs):
-        qs = Profile.all_named()
-        qs = qs.order_by('-association', 'display_name')
-        kwargs.setdefault('queryset', qs)
+        kwargs.setdefault('queryset', Profile.all_named())
         super(ProfileModelChoiceField, self).__init__(**kwargs)
 
     def label_from_instance(self, obj):
-        if obj.is_anonymous:
-            return '%s' % (obj,)
-        elif obj.association:
-            return '%s (%s)' % (obj, obj.association)
-        else:
-            return '%s (independent)' % (obj,)
+        return profile_label(get_profile_name(obj))
 
 
 class AssociationModelChoiceField(forms.ModelChoiceField):
@@ -0,0 +1,168 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import gc
+import os
+import json
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from stopwatch.models import TimeTrial
+
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'views.json')
+
+
+class Command(BaseCommand):
+    help = ('Measure the number of queries, the time and the peak memory ' +
+            'of the public views on a dataset from generate_kasse_data, ' +
+            'and compare them to a stored baseline. ' +
+            'All changes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=2000)
+        parser.add_argument('--timetrials', type=int, default=100000)
+        parser.add_argument('--expences', type=int, default=2000)
+        parser.add_argument('--images', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--existing', action='store_true',
+            help='Use the data in the database instead of generating data')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument(
+            '--save', action='store_true',
+            help='Store the results as the new baseline')
+        parser.add_argument(
+            '--threshold', type=float, default=0.25,
+            help='Allowed relative increase of time and memory')
+
+    def handle(self, *args, **options):
+        if options['existing']:
+            dataset = {'existing': True}
+        else:
+            dataset = {k: options[k] for k in
+                       ('profiles', 'timetrials', 'expences', 'images',
+                        'posts', 'seed')}
+        with transaction.atomic():
+            if not options['existing']:
+                call_command('generate_kasse_data',
+                             verbosity=options['verbosity'], **dataset)
+            dataset['vendor'] = connection.vendor
+            results = {'dataset': dataset,
+                       'views': self.benchmark(options['repeat'])}
+            transaction.set_rollback(True)
+
+        if options['save']:
+            os.makedirs(os.path.dirname(options['baseline']), exist_ok=True)
+            with open(options['baseline'], 'w') as fp:
+                json.dump(results, fp, indent=2, sort_keys=True)
+                fp.write('\n')
+            self.stdout.write('Saved %s' % options['baseline'])
+            return
+
+        try:
+            with open(options['baseline']) as fp:
+                baseline = json.load(fp)
+        except FileNotFoundError:
+            self.stdout.write('No baseline in %s' % options['baseline'])
+            return
+        if baseline['dataset'] != dataset:
+            raise CommandError(
+                'The baseline was measured on a different dataset: %r' %
+                (baseline['dataset'],))
+        errors = self.compare(
+            results['views'], baseline['views'], options['threshold'])
+        if errors:
+            raise CommandError('\n'.join(errors))
+        self.stdout.write('No regressions compared to %s' %
+                          options['baseline'])
+
+    def get_urls(self):
+        profile_id = TimeTrial.objects.order_by().values_list(
+            'profile_id', flat=True).first()
+        live_id = TimeTrial.objects.filter(result='').order_by(
+            '-start_time').values_list('pk', flat=True).first()
+        urls = [
+            ('home', '/'),
+            ('timetrial_list', '/timetrial/'),
+            ('timetrial_best', '/timetrial/best/'),
+            ('timetrial_best_current', '/timetrial/best/current/'),
+            ('timetrial_best_legs', '/timetrial/best/5/'),
+            ('profile_list', '/profile/'),
+            ('timetrial_json', '/timetrial/json/'),
+            ('timetrial_json_live', '/timetrial/json/live/'),
+            ('balance_list', '/iou/balance/'),
+            ('settlement', '/iou/settle/'),
+            ('settlement_json', '/iou/settle/json/'),
+        ]
+        if profile_id is not None:
+            urls.append(('profile', '/profile/%d/' % profile_id))
+        if live_id is not None:
+            urls.append(('timetrial_live', '/timetrial/%d/live/' % live_id))
+            urls.append(('timetrial_live_state',
+                         '/timetrial/%d/live/state/' % live_id))
+        return urls
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError('%s returned %s' % (url, response.status_code))
+        if response.streaming:
+            for chunk in response.streaming_content:
+                pass
+        return response
+
+    def benchmark(self, repeat):
+        results = {}
+        allowed_hosts = list(settings.ALLOWED_HOSTS) + ['testserver']
+        with override_settings(ALLOWED_HOSTS=allowed_hosts):
+            client = Client()
+            for name, url in self.get_urls():
+                # The first request fills the caches.
+                cache.clear()
+                with CaptureQueriesContext(connection) as ctx:
+                    self.request(client, url)
+                queries = len(ctx.captured_queries)
+                times = []
+                for i in range(repeat):
+                    t = time.perf_counter()
+                    self.request(client, url)
+                    times.append(time.perf_counter() - t)
+                gc.collect()
+                tracemalloc.start()
+                self.request(client, url)
+                memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                results[name] = {
+                    'queries': queries,
+                    'time': round(min(times), 4),
+                    'memory': memory,
+                }
+                self.stdout.write('%-24s %5d queries %8.3f s %8d KiB' % (
+                    name, queries, min(times), memory // 1024))
+        return results
+
+    def compare(self, results, baseline, threshold):
+        errors = []
+        for name, result in sorted(results.items()):
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                errors.append('%s: %d queries, baseline %d' % (
+                    name, result['queries'], base['queries']))
+            for key in ('time', 'memory'):
+                if result[key] > base[key] * (1 + threshold):
+                    errors.append('%s: %s %s, baseline %s' % (
+                        name, key, result[key], base[key]))
+        return errors
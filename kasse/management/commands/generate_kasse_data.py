@@ -0,0 +1,254 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import math
+import random
+import datetime
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from kasse.models import Association, Title, Profile, get_display_title
+from stopwatch.models import TimeTrial, Leg, Image, refresh_profile_stats
+from iou.models import Expence
+from news.models import Post
+
+
+ASSOCIATIONS = ['TÅGEKAMMERET', '@lkymia']
+
+TITLES = ['CERM', 'FORM', 'INKA', 'KASS', 'NF', 'PR', 'SEKR', 'VC']
+
+# (number of legs, weight) of finished TimeTrials.
+LEG_COUNTS = [(1, 30), (2, 6), (3, 6), (4, 4), (5, 40), (6, 6),
+              (10, 2), (24, 1)]
+
+# (result, weight) of TimeTrials that are not live.
+RESULTS = [('f', 85), ('dnf', 10), ('irr', 5)]
+
+
+def create(model, objects, batch_size):
+    """Insert the objects with bulk_create and return their primary keys.
+
+    bulk_create only sets the primary keys on some databases,
+    so read back the new rows instead.
+    """
+    qs = model._base_manager.order_by('-pk').values_list('pk', flat=True)
+    last = qs.first() or 0
+    model._base_manager.bulk_create(objects, batch_size=batch_size)
+    qs = model._base_manager.filter(pk__gt=last).order_by('pk')
+    return list(qs.values_list('pk', flat=True))
+
+
+def weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with synthetic associations, titles, ' +
+            'profiles, TimeTrials, images, expences and news posts ' +
+            'for benchmarks and load tests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--associations', type=int, default=2)
+        parser.add_argument('--profiles', type=int, default=2000)
+        parser.add_argument('--timetrials', type=int, default=100000)
+        parser.add_argument('--images', type=int, default=1000)
+        parser.add_argument('--expences', type=int, default=2000)
+        parser.add_argument('--posts', type=int, default=500)
+        parser.add_argument(
+            '--years', type=int, default=10,
+            help='Spread the TimeTrials over this many years')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Rows per INSERT (default: as many as the database allows)')
+        parser.add_argument(
+            '--chunk-size', type=int, default=20000,
+            help='Number of TimeTrials to keep in memory at a time')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.verbose = options['verbosity'] >= 1
+        self.now = timezone.now()
+        with transaction.atomic():
+            associations = self.generate_associations(
+                options['associations'])
+            profile_ids = self.generate_profiles(
+                associations, options['profiles'], options['years'])
+            timetrial_ids = self.generate_timetrials(
+                profile_ids, options['timetrials'], options['years'],
+                options['chunk_size'])
+            self.generate_images(timetrial_ids, options['images'])
+            self.generate_expences(
+                profile_ids, options['expences'], options['years'])
+            self.generate_posts(timetrial_ids, options['posts'])
+            for i in range(0, len(profile_ids), 500):
+                refresh_profile_stats(profile_ids[i:i + 500])
+        self.log('Generated data on %s' % connection.vendor)
+
+    def log(self, message):
+        if self.verbose:
+            self.stdout.write(message)
+
+    def generate_associations(self, count):
+        names = ASSOCIATIONS[:count]
+        names += ['Forening %d' % i for i in range(len(names), count)]
+        associations = []
+        for name in names:
+            a = Association.objects.filter(name=name).first()
+            if a is None:
+                a = Association.objects.create(
+                    name=name, current_period=self.now.year)
+            associations.append(a)
+        return associations
+
+    def generate_profiles(self, associations, count, years):
+        rng = self.rng
+        profiles = []
+        titles = []
+        for i in range(count):
+            association = rng.choice(associations + [None])
+            profiles.append(Profile(
+                name='Generated %d' % i, association=association))
+            if association is not None and rng.random() < 0.3:
+                # Titles from many periods, including old members
+                # who were active long before the first TimeTrial.
+                period = association.current_period - rng.randrange(
+                    years + 30)
+                t = Title(association=association, period=period,
+                          title=rng.choice(TITLES))
+                t.display_title = get_display_title(t)
+                titles.append((i, t))
+        title_ids = create(Title, [t for i, t in titles], self.batch_size)
+        for (i, t), pk in zip(titles, title_ids):
+            profiles[i].title_id = pk
+        profile_ids = create(Profile, profiles, self.batch_size)
+        self.log('Created %d profiles with %d titles' %
+                 (len(profile_ids), len(title_ids)))
+        return profile_ids
+
+    def generate_timetrials(self, profile_ids, count, years, chunk_size):
+        rng = self.rng
+        # A few profiles make most of the TimeTrials,
+        # and some profiles drink faster than others.
+        activity = [rng.paretovariate(1.2) for i in profile_ids]
+        skill = {i: rng.lognormvariate(0, 0.3) for i in profile_ids}
+        span = datetime.timedelta(days=365 * years).total_seconds()
+        timetrial_ids = []
+        leg_total = 0
+        if not profile_ids:
+            count = 0
+        for offset in range(0, count, chunk_size):
+            timetrials = []
+            durations = []
+            n = min(chunk_size, count - offset)
+            owners = rng.choices(profile_ids, activity, k=n)
+            for i, profile_id in enumerate(owners):
+                # Oldest first, about evenly spread over the span.
+                age = span * (1 - (offset + i) / count) + rng.uniform(0, 60)
+                start_time = self.now - datetime.timedelta(
+                    seconds=age + 7200)
+                result = weighted(rng, RESULTS)
+                leg_count = weighted(rng, LEG_COUNTS)
+                if result == 'dnf':
+                    leg_count = rng.randrange(leg_count)
+                if rng.random() < 0.8:
+                    creator_id = profile_id
+                else:
+                    creator_id = rng.choice(profile_ids)
+                timetrials.append(TimeTrial(
+                    profile_id=profile_id, creator_id=creator_id,
+                    result=result, state='stopped', start_time=start_time,
+                    created_time=start_time))
+                durations.append(self.leg_durations(
+                    skill[profile_id], leg_count))
+            if offset + n == count:
+                # A few live TimeTrials.
+                for i in range(3):
+                    start_time = self.now - datetime.timedelta(minutes=5 * i)
+                    profile_id = rng.choice(profile_ids)
+                    timetrials.append(TimeTrial(
+                        profile_id=profile_id, creator_id=profile_id,
+                        result='', state='running', start_time=start_time,
+                        created_time=start_time))
+                    durations.append(
+                        self.leg_durations(skill[profile_id], i))
+            for tt, ds in zip(timetrials, durations):
+                tt.set_leg_summary(ds)
+            ids = create(TimeTrial, timetrials, self.batch_size)
+            legs = []
+            for tt_id, tt, ds in zip(ids, timetrials, durations):
+                tt.pk = tt_id
+                legs.extend(tt.make_legs(ds))
+            Leg.raw_objects.bulk_create(legs, batch_size=self.batch_size)
+            timetrial_ids.extend(ids)
+            leg_total += len(legs)
+        self.log('Created %d TimeTrials with %d legs' %
+                 (len(timetrial_ids), leg_total))
+        return timetrial_ids
+
+    def leg_durations(self, skill, leg_count):
+        durations = []
+        for i in range(leg_count):
+            # Each leg is a bit slower than the previous one.
+            d = skill * self.rng.lognormvariate(math.log(10), 0.35)
+            durations.append(round(d * (1 + 0.1 * i), 2))
+        return durations
+
+    def generate_images(self, timetrial_ids, count):
+        rng = self.rng
+        images = []
+        for i in range(count if timetrial_ids else 0):
+            width, height = rng.choice([(1024, 768), (768, 1024)])
+            images.append(Image(
+                timetrial_id=rng.choice(timetrial_ids),
+                image='timetrial/generated-%d.jpg' % i,
+                width=width, height=height))
+        Image.objects.bulk_create(images, batch_size=self.batch_size)
+        self.log('Created %d images' % len(images))
+
+    def generate_expences(self, profile_ids, count, years):
+        rng = self.rng
+        span = datetime.timedelta(days=365 * years).total_seconds()
+        # Oldest first, like the TimeTrials.
+        ages = sorted((rng.uniform(0, span) for i in range(count)),
+                      reverse=True)
+        expences = [
+            Expence(payer_id=rng.choice(profile_ids),
+                    amount=Decimal(rng.randrange(100, 100000)) / 100,
+                    comment='Generated %d' % i,
+                    created_time=self.now - datetime.timedelta(seconds=age))
+            for i, age in enumerate(ages if profile_ids else [])]
+        expence_ids = create(Expence, expences, self.batch_size)
+        through = Expence.consumers.through
+        consumers = []
+        for expence_id in expence_ids:
+            k = min(len(profile_ids), rng.randint(1, 40))
+            for profile_id in rng.sample(profile_ids, k):
+                consumers.append(through(
+                    expence_id=expence_id, profile_id=profile_id))
+        through.objects.bulk_create(consumers, batch_size=self.batch_size)
+        # bulk_create does not send the signals that post to the ledger.
+        call_command('refresh_ledger', verbosity=0)
+        self.log('Created %d expences with %d consumers' %
+                 (len(expence_ids), len(consumers)))
+
+    def generate_posts(self, timetrial_ids, count):
+        rng = self.rng
+        posts = [Post(fbid='%d_%d' % (1000, i), text='Generated %d' % i)
+                 for i in range(count if timetrial_ids else 0)]
+        post_ids = create(Post, posts, self.batch_size)
+        through = Post.timetrials.through
+        links = []
+        for post_id in post_ids:
+            k = min(len(timetrial_ids), rng.randint(1, 3))
+            for timetrial_id in rng.sample(timetrial_ids, k):
+                links.append(through(
+                    post_id=post_id, timetrial_id=timetrial_id))
+        through.objects.bulk_create(links, batch_size=self.batch_size)
+        self.log('Created %d news posts' % len(post_ids))
@@ -7,6 +7,7 @@ from django.utils.functional import SimpleLazyObject
 from ipware.ip import get_real_ip
 
 from kasse.models import Profile, Association
+from kasse.profiling import profile_request
 
 
 def get_profile(request):
@@ -66,7 +67,7 @@ def filter_association(request, qs):
     a_id = request.session.get(KEY)
     if a_id is None:
         return qs
-    if qs.model.__name__ == 'TimeTrial':
+    if qs.model.__name__ in ('TimeTrial', 'PersonalBest'):
         return qs.filter(profile__association_id=a_id)
     else:
         raise Exception("Don't know how to handle %s" % (qs.model))
@@ -88,3 +89,11 @@ def Middleware(get_response):
         return get_response(request)
 
     return process_request
+
+
+def ProfilingMiddleware(get_response):
+    """Record the queries and time of each request in kasse.profiling."""
+    def process_request(request):
+        return profile_request(request, get_response)
+
+    return process_request
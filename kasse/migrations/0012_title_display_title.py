@@ -0,0 +1,60 @@
+# Generated by Django 2.2.3 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+def sup(n):
+    return ''.join('⁰¹²³⁴⁵⁶⁷⁸⁹'[int(i)] for i in str(n))
+
+
+def tk_prefix(age):
+    prefix = ['', 'G', 'B', 'O', 'TO']
+    if age < 0:
+        return 'K%s' % sup(-age)
+    elif age < len(prefix):
+        return prefix[age]
+    else:
+        return 'T%sO' % sup(age - 3)
+
+
+def get_display_title(title):
+    # A copy of kasse.models.get_display_title as it was when this
+    # migration was written, since the migration must not depend on
+    # code that may change later.
+    p = title.period
+    if p is None:
+        s = title.title
+    elif title.association.name == 'TÅGEKAMMERET':
+        age = title.association.current_period - p
+        s = '%s%s' % (tk_prefix(age), title.title)
+    elif title.association.name == '@lkymia':
+        year, semester = divmod(p % 100, 2)
+        s = '%s %s%02d' % (title.title, 'FE'[semester], year)
+    else:
+        s = '%s %s' % (title.title, p)
+    return s or '(blank)'
+
+
+def set_display_title(apps, schema_editor):
+    Title = apps.get_model('kasse', 'Title')
+    titles = list(Title.objects.select_related('association'))
+    for t in titles:
+        t.display_title = get_display_title(t)
+    Title.objects.bulk_update(titles, ['display_title'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kasse', '0011_profile_preferences_json'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='title',
+            name='display_title',
+            field=models.CharField(default='', editable=False, max_length=200),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_display_title, migrations.RunPython.noop),
+    ]
@@ -8,7 +8,7 @@ from django.utils.encoding import python_2_unicode_compatible
 from django.utils import formats, six
 from django.utils.safestring import mark_safe
 from django.utils.dateparse import parse_duration
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
 from kasse.managers import ProfileManager
@@ -28,12 +28,55 @@ class Association(models.Model):
     def none_string(cls):
         return '(independent)'
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super(Association, self).save(*args, **kwargs)
+            self.update_display_titles()
+
+    def update_display_titles(self):
+        """Recompute display_title of the titles of this association,
+        which depends on the name and current_period."""
+        changed = []
+        for t in self.title_set.all():
+            t.association = self
+            display_title = get_display_title(t)
+            if t.display_title != display_title:
+                t.display_title = display_title
+                changed.append(t)
+        Title.objects.bulk_update(changed, ['display_title'])
+
+
+def get_display_title(title):
+    """Return the display string of a title."""
+    p = title.period
+    if p is None:
+        s = title.title
+    elif title.association.name == 'TÅGEKAMMERET':
+        enable_efuit = False
+        if enable_efuit and title.title == 'EFUIT':
+            years = [2015, 2014, 2013, 2011, 2010]
+            age = 0
+            while age < len(years) and p < years[age]:
+                age += 1
+        else:
+            age = title.association.current_period - p
+        s = '%s%s' % (Title.tk_prefix(age), title.title)
+    elif title.association.name == '@lkymia':
+        s = '%s %s' % (title.title, APeriodField.static_prepare_value(p))
+    else:
+        s = '%s %s' % (title.title, p)
+    return s or '(blank)'
+
 
 @python_2_unicode_compatible
 class Title(models.Model):
     association = models.ForeignKey(Association, on_delete=models.CASCADE)
     period = models.IntegerField(null=True, blank=True)
     title = models.CharField(max_length=200)
+    # get_display_title(self), updated when the title or the association
+    # is saved. Stored so that the title can be displayed and ordered by
+    # without reading the association.
+    display_title = models.CharField(max_length=200, editable=False)
 
     @staticmethod
     def sup(n):
@@ -50,35 +93,12 @@ class Title(models.Model):
         else:
             return 'T%sO' % Title.sup(age - 3)
 
-    def tk_str(self):
-        enable_efuit = False
-        if enable_efuit and self.title == 'EFUIT':
-            years = [2015, 2014, 2013, 2011, 2010]
-            age = 0
-            while age < len(years) and self.period < years[age]:
-                age += 1
-        else:
-            age = self.association.current_period - self.period
-        return '%s%s' % (self.tk_prefix(age), self.title)
-
-    def a_str(self):
-        return '%s %s' % (
-            self.title, APeriodField.static_prepare_value(self.period))
-
-    def def_str(self):
-        return '%s %s' % (self.title, self.period)
+    def save(self, *args, **kwargs):
+        self.display_title = get_display_title(self)
+        super(Title, self).save(*args, **kwargs)
 
     def __str__(self):
-        p = self.period
-        if p is None:
-            s = self.title
-        elif self.association.name == 'TÅGEKAMMERET':
-            s = self.tk_str()
-        elif self.association.name == '@lkymia':
-            s = self.a_str()
-        else:
-            s = self.def_str()
-        return s or '(blank)'
+        return self.display_title or get_display_title(self)
 
     class Meta:
         ordering = ['association', 'period', 'title']
@@ -0,0 +1,126 @@
+# vim: set fileencoding=utf8:
+"""Display names of all profiles, computed in bulk.
+
+The display name of a profile depends on its title, its name and the
+current period of the association of the title, so it changes rarely:
+only when a Profile, Title or Association is saved or deleted.
+get_profile_names computes the names of all profiles in one query and keeps
+them in the process until the signal handlers in kasse.signals call
+invalidate_profile_names, which bumps the 'profile_names' version
+(see kasse.versions).
+"""
+from __future__ import absolute_import, unicode_literals, division
+
+import collections
+
+from kasse.models import Association, Title, Profile
+from kasse.versions import get_version, bump_version_on_commit
+
+
+ProfileName = collections.namedtuple(
+    'ProfileName', 'name association_id association is_anonymous')
+
+# (version, names, choices) computed in this process.
+_profile_names = (None, None, None)
+
+
+def build_profile_names():
+    """Return {profile id: ProfileName} for all profiles.
+
+    The names are str() of the profiles, computed from the stored
+    display_title of the titles.
+    """
+    associations = {a.pk: '%s' % (a,) for a in Association.objects.all()}
+    profile_qs = Profile.objects.order_by().values_list(
+        'id', 'name', 'association_id', 'title__display_title')
+    names = {}
+    for (profile_id, name, association_id,
+         display_title) in profile_qs.iterator():
+        profile = Profile(pk=profile_id, name=name)
+        if display_title is not None:
+            profile.title = Title(display_title=display_title)
+        names[profile_id] = ProfileName(
+            '%s' % (profile,), association_id,
+            associations.get(association_id, Association.none_string()),
+            profile.is_anonymous)
+    return names
+
+
+def build_profile_choices(names):
+    """Return [(profile id, label)] of the profiles that are not
+    anonymous, grouped by association."""
+    choices = [(pk, n) for pk, n in names.items() if not n.is_anonymous]
+    # Independent profiles last, as in ORDER BY association_id DESC.
+    choices.sort(key=lambda c: (-(c[1].association_id or 0), c[1].name))
+    return [(pk, profile_label(n)) for pk, n in choices]
+
+
+def profile_label(profile_name):
+    """Return the name and association of a profile
+    as shown when choosing a profile."""
+    if profile_name.is_anonymous:
+        return profile_name.name
+    elif profile_name.association_id is not None:
+        return '%s (%s)' % (profile_name.name, profile_name.association)
+    else:
+        return '%s (independent)' % (profile_name.name,)
+
+
+def get_profile_names_version():
+    """Return the version of the names, which changes when a profile,
+    title or association is changed."""
+    return get_version('profile_names')
+
+
+def get_profile_names():
+    """Return {profile id: ProfileName}, reusing the names computed by
+    this process if no profile, title or association has been changed."""
+    return _get_profile_names()[1]
+
+
+def get_profile_choices():
+    """Return (version, choices) with choices from build_profile_choices.
+    """
+    global _profile_names
+    version, names, choices = _get_profile_names()
+    if choices is None:
+        choices = build_profile_choices(names)
+        _profile_names = (version, names, choices)
+    return version, choices
+
+
+def _get_profile_names():
+    global _profile_names
+    version = get_profile_names_version()
+    if _profile_names[0] != version or _profile_names[1] is None:
+        _profile_names = (version, build_profile_names(), None)
+    return _profile_names
+
+
+def get_profile_name(profile):
+    """Return the ProfileName of a Profile.
+
+    Profiles that are not saved yet are computed directly.
+    """
+    pk = getattr(profile, 'pk', None)
+    if pk is not None:
+        try:
+            return get_profile_names()[pk]
+        except KeyError:
+            pass
+    association = getattr(profile, 'association', None)
+    return ProfileName(
+        '%s' % (profile,), getattr(association, 'pk', None),
+        '%s' % (association or Association.none_string(),),
+        getattr(profile, 'is_anonymous', False))
+
+
+def display_name(profile):
+    """Return the display name of a Profile, i.e. str(profile)."""
+    return get_profile_name(profile).name
+
+
+def invalidate_profile_names():
+    """Recompute the names in all processes after the current transaction.
+    """
+    bump_version_on_commit('profile_names')
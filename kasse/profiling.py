@@ -0,0 +1,120 @@
+# vim: set fileencoding=utf8:
+"""Per-request SQL profiling.
+
+ProfilingMiddleware in kasse.middleware is opt-in: add
+'kasse.middleware.ProfilingMiddleware' to MIDDLEWARE to record the number
+of queries, the SQL time, the repeated queries and the view time of each
+request. The latest PROFILE_BUFFER_SIZE requests are kept in a ring buffer
+in the process and summarized per URL name on the superuser-only page
+/log/profiling/.
+"""
+from __future__ import absolute_import, unicode_literals, division
+
+import collections
+import threading
+import time
+
+from django.db import connection
+from django.utils import timezone
+
+
+PROFILE_BUFFER_SIZE = 1000
+
+RequestProfile = collections.namedtuple(
+    'RequestProfile',
+    'time url_name path status view_time sql_time queries duplicates ' +
+    'duplicate_sql duplicate_count')
+
+
+class QueryRecorder(object):
+    """Execute wrapper that records the SQL and duration of each query.
+
+    The SQL is recorded without parameters, so the same query made for
+    each object in a loop (N+1 queries) is recorded as one repeated query.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+
+class RingBuffer(object):
+    """The latest RequestProfiles of the process."""
+
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._records = collections.deque(maxlen=size)
+
+    def append(self, record):
+        with self._lock:
+            self._records.append(record)
+
+    def get(self):
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+buffer = RingBuffer(PROFILE_BUFFER_SIZE)
+
+
+def profile_request(request, get_response):
+    """Call get_response, record a RequestProfile and return the response.
+    """
+    recorder = QueryRecorder()
+    start = time.perf_counter()
+    with connection.execute_wrapper(recorder):
+        response = get_response(request)
+    view_time = time.perf_counter() - start
+
+    counts = collections.Counter(sql for sql, duration in recorder.queries)
+    if counts:
+        duplicate_sql, duplicate_count = counts.most_common(1)[0]
+    else:
+        duplicate_sql, duplicate_count = '', 0
+    match = getattr(request, 'resolver_match', None)
+    buffer.append(RequestProfile(
+        time=timezone.now(),
+        url_name=(match and match.url_name) or '(%s)' % response.status_code,
+        path=request.get_full_path(),
+        status=response.status_code,
+        view_time=view_time,
+        sql_time=sum(duration for sql, duration in recorder.queries),
+        queries=len(recorder.queries),
+        duplicates=len(recorder.queries) - len(counts),
+        duplicate_sql=duplicate_sql,
+        duplicate_count=duplicate_count,
+    ))
+    return response
+
+
+def summarize(records):
+    """Return a dict for each URL name with the number of requests,
+    the mean and max view time, SQL time and number of queries,
+    and the request with the most repeated queries."""
+    by_name = collections.OrderedDict()
+    for r in records:
+        by_name.setdefault(r.url_name, []).append(r)
+    summary = []
+    for url_name, rs in by_name.items():
+        n = len(rs)
+        summary.append({
+            'url_name': url_name,
+            'requests': n,
+            'view_time': sum(r.view_time for r in rs) / n,
+            'max_view_time': max(r.view_time for r in rs),
+            'sql_time': sum(r.sql_time for r in rs) / n,
+            'queries': sum(r.queries for r in rs) / n,
+            'max_queries': max(r.queries for r in rs),
+            'worst': max(rs, key=lambda r: (r.duplicate_count, r.queries)),
+        })
+    return summary
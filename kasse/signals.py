@@ -0,0 +1,25 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from kasse.models import Association, Title, Profile, Contest
+from kasse.names import invalidate_profile_names
+from kasse.versions import bump_version_on_commit
+
+
+@receiver(post_save, sender=Association)
+@receiver(post_delete, sender=Association)
+@receiver(post_save, sender=Title)
+@receiver(post_delete, sender=Title)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def profile_name_changed(sender, **kwargs):
+    invalidate_profile_names()
+
+
+@receiver(post_save, sender=Contest)
+@receiver(post_delete, sender=Contest)
+def contest_changed(sender, **kwargs):
+    bump_version_on_commit('contests')
@@ -1,6 +1,13 @@
 function home_init() {
 	var username = document.querySelector('select[name=profile]');
 	if (!username) return;
+	// The profiles are added by kasse/profileselect.js.
+	username.addEventListener('profileindexload', function () {
+		awesomplete_init(username);
+	}, false);
+}
+
+function awesomplete_init(username) {
 	var names = [];
 	var name_to_index = {};
 	var options = [].slice.call(username.options);
@@ -0,0 +1,38 @@
+function load_more(link) {
+	var container = link.parentNode;
+	var tbody = container.parentNode.querySelector('tbody');
+	var xhr = new XMLHttpRequest();
+	xhr.open('GET', link.getAttribute('data-load-more'));
+	xhr.onload = function () {
+		if (xhr.status !== 200) {
+			window.location.href = link.href;
+			return;
+		}
+		var page = document.createElement('div');
+		page.innerHTML = xhr.responseText;
+		var rows = [].slice.call(page.querySelectorAll('tr'));
+		for (var i = 0; i < rows.length; ++i) tbody.appendChild(rows[i]);
+		var next = page.querySelector('.load_more');
+		if (next) {
+			container.parentNode.replaceChild(next, container);
+			load_more_init(next);
+		} else {
+			container.parentNode.removeChild(container);
+		}
+	};
+	xhr.send();
+}
+
+function load_more_init(root) {
+	var links = root.querySelectorAll('a[data-load-more]');
+	for (var i = 0; i < links.length; ++i) {
+		links[i].addEventListener('click', function (ev) {
+			ev.preventDefault();
+			load_more(this);
+		}, false);
+	}
+}
+
+window.addEventListener('load', function () {
+	load_more_init(document);
+}, false);
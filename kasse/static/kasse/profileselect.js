@@ -0,0 +1,34 @@
+function fill_profile_select(select, profiles) {
+	var selected = select.value;
+	var options = [].slice.call(select.options);
+	for (var i = 0; i < options.length; ++i) {
+		if (options[i].value !== "") select.removeChild(options[i]);
+	}
+	for (var i = 0; i < profiles.length; ++i) {
+		var option = document.createElement('option');
+		option.value = '' + profiles[i][0];
+		option.textContent = profiles[i][1];
+		option.selected = (option.value === selected);
+		select.appendChild(option);
+	}
+}
+
+function load_profile_select(select) {
+	var xhr = new XMLHttpRequest();
+	xhr.open('GET', select.getAttribute('data-profile-index'));
+	xhr.onload = function () {
+		if (xhr.status !== 200) return;
+		fill_profile_select(select, JSON.parse(xhr.responseText).profiles);
+		var ev = document.createEvent('Event');
+		ev.initEvent('profileindexload', false, false);
+		select.dispatchEvent(ev);
+	};
+	xhr.send();
+}
+
+function profile_select_init() {
+	var selects = document.querySelectorAll('select[data-profile-index]');
+	for (var i = 0; i < selects.length; ++i) load_profile_select(selects[i]);
+}
+
+window.addEventListener('load', profile_select_init, false);
@@ -7,27 +7,31 @@ from django.urls import reverse
 from django.utils.html import conditional_escape
 from django.utils.safestring import mark_safe
 
+from kasse.names import get_profile_name
+
 register = template.Library()
 
 
 @register.filter(is_safe=True, needs_autoescape=True)
 def display_profile(profile, autoescape=True):
-    association = conditional_escape(profile.get_association_display())
-    profile_id = profile.pk
+    profile_name = get_profile_name(profile)
+    association = conditional_escape(profile_name.association)
+    name = profile_name.name
     if autoescape:
-        profile = conditional_escape(profile)
+        name = conditional_escape(name)
     return mark_safe(
         '<a href="%s" title="%s" class="profile_link">%s</a>' % (
-            reverse('profile', kwargs={'pk': profile_id}),
+            reverse('profile', kwargs={'pk': profile.pk}),
             association,
-            profile))
+            name))
 
 
 @register.filter(is_safe=True, needs_autoescape=True)
 def display_profile_plain(profile, autoescape=True):
+    name = get_profile_name(profile).name
     if autoescape:
-        profile = conditional_escape(profile)
-    return mark_safe('%s' % (profile,))
+        name = conditional_escape(name)
+    return mark_safe('%s' % (name,))
 
 
 @register.filter
@@ -11,9 +11,10 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 from kasse.views import (
-    Home, Log, Login, Logout, ProfileCreate, ChangePassword, ProfileView,
-    ProfileEdit, ProfileEditAdmin, UserCreate, Association, ProfileList,
-    ProfileMerge, ContestCreate, AssociationPeriodUpdate,
+    Home, Log, Profiling, Login, Logout, ProfileCreate, ChangePassword,
+    ProfileView, ProfileEdit, ProfileEditAdmin, UserCreate, Association,
+    ProfileList, ProfileMerge, ProfileJson, ContestCreate,
+    AssociationPeriodUpdate,
 )
 import stopwatch.urls
 import iou.urls
@@ -28,6 +29,7 @@ urlpatterns = [
 
     url(r'^$', Home.as_view(), name='home'),
     url(r'^log/$', Log.as_view(), name='log'),
+    url(r'^log/profiling/$', Profiling.as_view(), name='profiling'),
 
     url(r'^login/$', Login.as_view(), name='login'),
     url(r'^logout/$', Logout.as_view(), name='logout'),
@@ -39,8 +41,12 @@ urlpatterns = [
         name='newuser'),
     url(r'^profile/$', ProfileList.as_view(),
         name='profile_list'),
+    url(r'^profile/json/$', ProfileJson.as_view(),
+        name='profile_json'),
     url(r'^profile/(?P<pk>\d+)/$', ProfileView.as_view(),
         name='profile'),
+    url(r'^profile/(?P<pk>\d+)/more/$', ProfileView.as_view(),
+        name='profile_more', kwargs={'fragment': True}),
     url(r'^profile/(?P<pk>\d+)/merge/$', ProfileMerge.as_view(),
         name='profile_merge'),
     url(r'^profile/edit/$', ProfileEdit.as_view(),
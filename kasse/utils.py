@@ -0,0 +1,41 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import threading
+
+from django.db import connection, transaction
+
+
+_batches = threading.local()
+
+
+def on_commit_batch(key, items, flush):
+    """Call flush(items) when the current transaction commits with the
+    items of every call with the same key made in the transaction,
+    so work triggered by many signals is only done once.
+
+    Outside a transaction, flush is called immediately. If the
+    transaction is rolled back, the items are discarded. Items added in a
+    savepoint that is rolled back are still flushed if the batch was
+    started before the savepoint, so flush must read the current data
+    from the database instead of trusting the items.
+    """
+    batches = _batches.__dict__
+    batch = batches.get(key)
+    if batch is not None and not any(
+            func is batch[1] for sids, func in connection.run_on_commit):
+        # The callback was discarded, since the transaction (or the
+        # savepoint) that started the batch was rolled back.
+        batch = None
+    if batch is not None:
+        batch[0].extend(items)
+        return
+
+    def run():
+        if batches.get(key) is batch:
+            del batches[key]
+        flush(batch[0])
+
+    batch = (list(items), run)
+    batches[key] = batch
+    transaction.on_commit(run)
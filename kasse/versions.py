@@ -0,0 +1,49 @@
+# vim: set fileencoding=utf8:
+"""Version numbers of cached data.
+
+A version is a random string stored in the cache under a name, e.g.
+'timetrials'. Code that caches something derived from the data includes
+the version in the cache key, and code that changes the data calls
+bump_version, so that the cached values are no longer used.
+
+The versions only reach the other processes if they share the cache,
+so the site needs a shared cache backend (see CACHES in
+kasse.settings.common).
+"""
+from __future__ import absolute_import, unicode_literals, division
+
+import functools
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Versions never expire, so cached values are used until the data changes.
+VERSION_TIMEOUT = None
+
+
+def version_cache_key(name):
+    return 'kasse.versions.%s' % name
+
+
+def get_version(name):
+    key = version_cache_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    cache.set(version_cache_key(name), uuid.uuid4().hex, VERSION_TIMEOUT)
+
+
+def bump_version_on_commit(name):
+    """Bump the version after the current transaction.
+
+    Doing it earlier would let another process cache the data from
+    before the transaction under the new version.
+    """
+    transaction.on_commit(functools.partial(bump_version, name))
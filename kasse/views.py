@@ -3,6 +3,7 @@ from __future__ import absolute_import, unicode_literals, division
 
 import datetime
 import functools
+import json
 import logging
 import os
 import re
@@ -15,6 +16,9 @@ from django.utils.six.moves import urllib_parse
 from django.utils.decorators import method_decorator
 from django.utils import timezone
 from django.utils.html import format_html
+from django.utils.functional import SimpleLazyObject
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.http import (
     HttpResponse, HttpResponseRedirect, HttpResponseServerError,
     Http404,
@@ -26,8 +30,7 @@ from django.views.defaults import permission_denied
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import PasswordChangeForm
 from django.conf import settings
-from django.db.utils import NotSupportedError
-from django.db.models import Count
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 from django.template.response import SimpleTemplateResponse
 
@@ -38,11 +41,17 @@ from kasse.forms import (
     ContestForm, AssociationPeriodForm,
 )
 from kasse.models import Profile, Contest
+from kasse.managers import annotate_display_name
+from kasse.names import get_profile_choices
+from kasse.profiling import summarize
+import kasse.profiling
+from kasse.versions import get_version
 import kasse.models
 
 import stopwatch.models
 import iou.models
-from stopwatch.models import TimeTrial
+from stopwatch.models import TimeTrial, PersonalBest, ProfileStats
+from stopwatch.pagination import get_page_context
 
 logger = logging.getLogger('kasse')
 
@@ -71,25 +80,12 @@ class Home(TemplateView):
         qs = qs.order_by('-start_time')
         return list(qs[:5])
 
-    def get_best(self, **kwargs):
-        limit = kwargs.pop('limit', None)
-        leg_count = kwargs.pop('leg_count', 5)
-        qs = TimeTrial.objects.all()
+    def get_best(self, limit=None, leg_count=5, season=None):
+        qs = PersonalBest.objects.filter(
+            prefix=False, leg_count=leg_count, season=season)
         qs = self.request.filter_association(qs)
-        if kwargs:
-            qs = qs.filter(**kwargs)
-        qs = qs.filter(result='f', leg_count=leg_count)
         qs = qs.order_by('duration')
-        try:
-            qs_distinct = qs.distinct('profile')
-            return list(qs_distinct[:limit])
-        except (NotImplementedError, NotSupportedError):
-            res = {}
-            for tt in qs:
-                res.setdefault(tt.profile_id, tt)
-                if limit is not None and len(res) >= limit:
-                    break
-            return sorted(res.values(), key=lambda tt: tt.duration)
+        return [pb.timetrial for pb in qs[:limit]]
 
     @staticmethod
     def get_season_start():
@@ -99,7 +95,7 @@ class Home(TemplateView):
 
     def get_current_best(self, **kwargs):
         season_start = Home.get_season_start()
-        return self.get_best(start_time__gt=season_start, **kwargs)
+        return self.get_best(season=season_start.year, **kwargs)
 
     def get_live(self):
         qs = TimeTrial.objects.all()
@@ -113,13 +109,21 @@ class Home(TemplateView):
     def get_context_data(self, **kwargs):
         context_data = super(Home, self).get_context_data(**kwargs)
         context_data['login_form'] = LoginForm()
-        context_data['live'] = self.get_live()
-        context_data['latest'] = self.get_latest()
-        context_data['best'] = self.get_best(limit=5)
+        # The TimeTrial sections other than Live are cached in the template
+        # with these versions in the key, so only query on a cache miss.
+        # Live is not cached, since it depends on the current time.
+        context_data['timetrials_version'] = get_version('timetrials')
+        context_data['profile_names_version'] = get_version('profile_names')
+        context_data['contests_version'] = get_version('contests')
+        context_data['live'] = SimpleLazyObject(self.get_live)
+        context_data['latest'] = SimpleLazyObject(self.get_latest)
+        context_data['best'] = SimpleLazyObject(
+            functools.partial(self.get_best, limit=5))
         season_start = self.get_season_start()
         context_data['current_season'] = '%d/%d' % (
             season_start.year, season_start.year - 2000 + 1)
-        context_data['current_season_best'] = self.get_current_best(limit=5)
+        context_data['current_season_best'] = SimpleLazyObject(
+            functools.partial(self.get_current_best, limit=5))
         context_data['association_form'] = AssociationForm(
             initial={'association': self.request.association}
         )
@@ -217,16 +221,31 @@ class ProfileCreate(FormView):
 
 class ProfileView(DetailView):
     template_name = 'kasse/profile.html'
+    fragment_template_name = 'stopwatch/timetrialpage.html'
     model = Profile
 
+    def get_template_names(self):
+        if self.kwargs.get('fragment'):
+            return [self.fragment_template_name]
+        return [self.template_name]
+
     def get_context_data(self, **kwargs):
         context_data = super(ProfileView, self).get_context_data(**kwargs)
+        qs = self.object.timetrial_profile_set.exclude(result='')
+        context_data.update(get_page_context(
+            self.request, qs,
+            reverse('profile', kwargs={'pk': self.object.pk}),
+            reverse('profile_more', kwargs={'pk': self.object.pk})))
+        if self.kwargs.get('fragment'):
+            return context_data
         context_data['is_self'] = self.request.profile == self.object
-        qs = self.object.timetrial_profile_set.all()
-        qs = qs.exclude(result='')
-        qs = qs.order_by('-start_time')
-        context_data['timetrial_list'] = qs
-        context_data['leg_count'] = sum(len(tt.leg_set.all()) for tt in qs)
+        try:
+            stats = self.object.timetrial_stats
+        except ProfileStats.DoesNotExist:
+            stats = ProfileStats(profile=self.object)
+        context_data['attempt_count'] = stats.attempt_count
+        context_data['leg_count'] = stats.leg_count
+        context_data['leg_count_stats'] = stats.get_leg_count_stats()
         return context_data
 
 
@@ -236,11 +255,36 @@ class ProfileList(ListView):
 
     def get_queryset(self):
         qs = Profile.all_named()
-        qs = qs.annotate(timetrial_count=Count('timetrial_profile_set'))
+        qs = qs.annotate(timetrial_count=Coalesce(
+            'timetrial_stats__timetrial_count', 0))
         qs = qs.order_by('-timetrial_count')
         return qs
 
 
+class ProfileJson(View):
+    '''Labels of the named profiles for kasse/profileselect.js.
+
+    The URL rendered by ProfileSelect contains the current version,
+    so the browser may cache the response until a profile is changed.
+    '''
+
+    def get(self, request):
+        version, choices = get_profile_choices()
+        etag = quote_etag(version)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data = {'version': version, 'profiles': choices}
+            response = HttpResponse(
+                json.dumps(data, separators=(',', ':')),
+                content_type='application/json')
+        response['ETag'] = etag
+        if request.GET.get('v') == version:
+            response['Cache-Control'] = 'max-age=86400'
+        else:
+            response['Cache-Control'] = 'no-cache'
+        return response
+
+
 @superuser_required
 class ProfileMerge(FormView):
     template_name = 'kasse/profile_merge.html'
@@ -396,6 +440,33 @@ class Log(View):
         return HttpResponse(s, content_type='text/plain; charset=utf8')
 
 
+@superuser_required
+class Profiling(TemplateView):
+    '''Summary of the requests recorded by ProfilingMiddleware
+    in this process.'''
+
+    template_name = 'kasse/profiling.html'
+
+    def post(self, request):
+        kasse.profiling.buffer.clear()
+        return HttpResponseRedirect(reverse('profiling'))
+
+    def get_context_data(self, **kwargs):
+        context_data = super(Profiling, self).get_context_data(**kwargs)
+        records = kasse.profiling.buffer.get()
+        summary = summarize(records)
+        context_data['enabled'] = (
+            'kasse.middleware.ProfilingMiddleware' in settings.MIDDLEWARE)
+        context_data['request_count'] = len(records)
+        context_data['buffer_size'] = kasse.profiling.PROFILE_BUFFER_SIZE
+        context_data['slowest'] = sorted(
+            summary, key=lambda s: s['view_time'], reverse=True)[:20]
+        context_data['offenders'] = sorted(
+            (s for s in summary if s['worst'].duplicate_count > 1),
+            key=lambda s: s['worst'].duplicate_count, reverse=True)[:20]
+        return context_data
+
+
 class Association(FormView):
     form_class = AssociationForm
     template_name = 'kasse/association.html'
@@ -446,7 +517,7 @@ class AssociationPeriodUpdate(FormView):
         data = super(AssociationPeriodUpdate, self).get_form_kwargs(**kwargs)
         data['titles'] = self.get_titles()
         qs = Profile.all_named().filter(association=self.get_association())
-        qs = qs.order_by('display_name')
+        qs = annotate_display_name(qs).order_by('display_name')
         data['profiles'] = qs
         return data
 
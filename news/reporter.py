@@ -9,6 +9,7 @@ from django.utils.encoding import python_2_unicode_compatible
 from django.utils import timezone
 from django.db.models import Q
 
+from kasse.names import display_name
 from kasse.templatetags.kasse_extras import display_duration_plain
 from news.facebook import ServiceUnavailable
 
@@ -143,10 +144,11 @@ def join_names(profiles):
     if not profiles:
         return 'Ingen'
     if len(profiles) == 1:
-        return '%s' % (profiles[0],)
+        return display_name(profiles[0])
     else:
         return '%s og %s' % (
-            ', '.join('%s' % (p,) for p in profiles[:-1]), profiles[-1])
+            ', '.join(display_name(p) for p in profiles[:-1]),
+            display_name(profiles[-1]))
 
 
 def join_parts(sentences, ucfirst):
@@ -238,7 +240,8 @@ def describe_timetrial_state(profiles):
         done.sort(key=lambda v: v[2].time)
         texts.append("Tiderne blev:")
         for k, profile, args in done:
-            texts.append(done_tpl[k] % dict(profile=profile, **args._asdict()))
+            texts.append(done_tpl[k] % dict(profile=display_name(profile),
+                                            **args._asdict()))
     for key in 'time irr dnf started upcoming'.split():
         if list_mode and key in done_tpl.keys():
             continue
@@ -255,13 +258,15 @@ def describe_timetrial_state(profiles):
             t = tpl['%s1' % key]
             parts = []
             for v in values:
-                parts.append(t % dict(profile=v[0], **v[1]._asdict()))
+                parts.append(t % dict(profile=display_name(v[0]),
+                                     **v[1]._asdict()))
             texts.append(join_parts(parts, ucfirst=(t[0] != '%')))
         elif ('%s+' % key) in tpl:
             texts.append(tpl['%s+' % key] % join_names(profiles))
         elif key in tpl:
             for v in values:
-                texts.append(tpl[key] % dict(profile=v[0], **v[1]._asdict()))
+                texts.append(tpl[key] % dict(profile=display_name(v[0]),
+                                             **v[1]._asdict()))
 
     return '\n'.join(texts)
 
@@ -277,7 +282,7 @@ def comment_to_string(profile, comment):
         'residue': '%(profile)ss rest var %(residue)g cL.',
         'comment': '%(profile)ss kommentar: "%(comment)s".',
     }
-    return tpl[kind] % dict(profile=profile, **args)
+    return tpl[kind] % dict(profile=display_name(profile), **args)
 
 
 def info_links(tts):
@@ -56,6 +56,10 @@ class TimeTrialAdmin(admin.ModelAdmin):
     get_leg_count.short_description = 'Leg count'
     get_leg_count.admin_order_field = 'leg_count'
 
+    def save_model(self, request, obj, form, change):
+        super(TimeTrialAdmin, self).save_model(request, obj, form, change)
+        obj.refresh_legs()
+
 
 class LegAdmin(admin.ModelAdmin):
     list_display = ('get_name', 'timetrial', 'order', 'duration')
@@ -65,6 +69,14 @@ class LegAdmin(admin.ModelAdmin):
         return '%s.%s %s' % (o.timetrial_id, o.order, o.duration)
     get_name.short_description = 'Leg'
 
+    def save_model(self, request, obj, form, change):
+        super(LegAdmin, self).save_model(request, obj, form, change)
+        obj.timetrial.refresh_legs()
+
+    def delete_model(self, request, obj):
+        super(LegAdmin, self).delete_model(request, obj)
+        obj.timetrial.refresh_legs()
+
 
 admin.site.register(TimeTrial, TimeTrialAdmin)
 admin.site.register(Leg, LegAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class StopwatchConfig(AppConfig):
     name = 'stopwatch'
+
+    def ready(self):
+        from stopwatch import signals  # noqa: F401
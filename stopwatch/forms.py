@@ -4,6 +4,7 @@ from __future__ import absolute_import, unicode_literals, division
 import datetime
 
 from django import forms
+from django.db import transaction
 from django.utils import timezone
 
 from multiupload.fields import MultiFileField
@@ -135,7 +136,8 @@ class TimeTrialForm(forms.ModelForm):
 
     def save(self):
         instance = super(TimeTrialForm, self).save(commit=False)
-        instance.save_robust()
-        instance.set_legs(
-            [d.total_seconds() for d in self.cleaned_data['durations']])
+        with transaction.atomic():
+            instance.save_robust()
+            instance.set_legs(
+                [d.total_seconds() for d in self.cleaned_data['durations']])
         return instance
@@ -0,0 +1,104 @@
+# vim: set fileencoding=utf8:
+"""Cached snapshots of the state of live TimeTrials.
+
+Spectators of a live TimeTrial poll its state every few seconds.
+get_live_state serves the state from the cache, and when the TimeTrial
+or its legs are changed (e.g. by TimeTrialLiveUpdate), the signal handlers
+in stopwatch.signals rebuild the snapshot once after the commit, so the
+database is only read once per update regardless of the number of
+spectators.
+
+With a cache shared by all processes (see CACHES in the settings),
+spectators see an update on their next poll. With a per-process cache,
+the other processes serve their snapshot until it expires after
+LIVE_STATE_TIMEOUT seconds.
+"""
+from __future__ import absolute_import, unicode_literals, division
+
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from kasse.utils import on_commit_batch
+from stopwatch.models import TimeTrial
+
+
+# Snapshots expire quickly, since the cache may be local to the process
+# and then is not updated by changes made in other processes.
+# The stopwatch polls every 2 seconds.
+LIVE_STATE_TIMEOUT = 2
+
+
+def live_state_cache_key(pk):
+    return 'stopwatch.live.%s' % pk
+
+
+def build_live_state(timetrial, durations):
+    """Return a snapshot of the state of a TimeTrial.
+
+    The snapshot contains the state returned by
+    TimeTrialStateMixin.get_state without elapsed_time and time_attack,
+    the start time as a timestamp and a version computed from the rest.
+    """
+    state = {
+        'durations': durations,
+        'state': timetrial.state,
+        'result': timetrial.result,
+        'result_display': timetrial.get_result_display(),
+    }
+    if timetrial.start_time is None:
+        start_time = None
+    else:
+        start_time = timetrial.start_time.timestamp()
+    data = json.dumps([state, start_time], sort_keys=True)
+    version = hashlib.md5(data.encode('utf8')).hexdigest()
+    return {'version': version, 'start_time': start_time, 'state': state}
+
+
+def load_live_state(pk):
+    """Store a new snapshot of a TimeTrial in the cache and return it."""
+    key = live_state_cache_key(pk)
+    try:
+        timetrial = TimeTrial.raw_objects.get(pk=pk)
+    except TimeTrial.DoesNotExist:
+        cache.delete(key)
+        return None
+    snapshot = build_live_state(timetrial, timetrial.get_durations())
+    cache.set(key, snapshot, LIVE_STATE_TIMEOUT)
+    return snapshot
+
+
+def get_live_state(pk):
+    """Return the snapshot of the TimeTrial with the given pk,
+    or None if it does not exist."""
+    snapshot = cache.get(live_state_cache_key(pk))
+    if snapshot is None:
+        snapshot = load_live_state(pk)
+    return snapshot
+
+
+def get_live_state_data(snapshot):
+    """Add elapsed_time to the state in a snapshot."""
+    data = dict(snapshot['state'])
+    if snapshot['start_time'] is None:
+        data['elapsed_time'] = 0
+    else:
+        now = timezone.now().timestamp()
+        data['elapsed_time'] = now - snapshot['start_time']
+    return data
+
+
+def refresh_live_state_on_commit(pk):
+    """Rebuild the snapshot of a TimeTrial when the current transaction
+    commits.
+
+    Doing it earlier would cache the state from before the transaction.
+    """
+    on_commit_batch('refresh_live_state', [pk], _refresh_pending_live_states)
+
+
+def _refresh_pending_live_states(pks):
+    for pk in set(pks):
+        load_live_state(pk)
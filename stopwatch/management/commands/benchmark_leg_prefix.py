@@ -0,0 +1,88 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, Count, Sum
+
+from stopwatch.models import TimeTrial, Leg, iter_cumulative_durations
+
+
+# Each implementation returns [(TimeTrial pk, duration of the first n legs)]
+# of the TimeTrials with at least n legs.
+
+
+def aggregate_leg_prefix(n):
+    # The implementation before Leg stored cumulative_duration:
+    # aggregate the first n legs of every TimeTrial.
+    qs = TimeTrial.raw_objects.filter(leg__order__lt=n + 1)
+    qs = qs.annotate(prefix_leg_count=Count('leg'),
+                     prefix_duration=Sum('leg__duration'))
+    qs = qs.filter(prefix_leg_count=n, prefix_duration__gt=0)
+    return list(qs.values_list('pk', 'prefix_duration'))
+
+
+def window_leg_prefix(n):
+    rows = iter_cumulative_durations(Leg.raw_objects.filter(order__lte=n))
+    return [(tt_id, d) for pk, tt_id, order, d in rows
+            if order == n and d > 0]
+
+
+def stored_leg_prefix(n):
+    # Read the cumulative_duration stored on the n'th leg.
+    qs = TimeTrial.raw_objects.filter(
+        leg__order=n, leg__cumulative_duration__gt=0)
+    qs = qs.annotate(prefix_duration=F('leg__cumulative_duration'))
+    return list(qs.values_list('pk', 'prefix_duration'))
+
+
+class Command(BaseCommand):
+    help = ('Compare ways of computing the duration of the first n legs ' +
+            'on a synthetic dataset. All changes are rolled back.')
+
+    IMPLEMENTATIONS = (
+        ('aggregate', aggregate_leg_prefix),
+        ('window', window_leg_prefix),
+        ('stored', stored_leg_prefix),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timetrials', type=int, default=100000)
+        parser.add_argument('--profiles', type=int, default=1000)
+        parser.add_argument('--legs', type=int, nargs='+', default=[1, 3, 5])
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            call_command(
+                'generate_kasse_data', profiles=options['profiles'],
+                timetrials=options['timetrials'], images=0, expences=0,
+                posts=0, seed=options['seed'],
+                verbosity=options['verbosity'])
+            for n in options['legs']:
+                self.benchmark(n, options['repeat'])
+            transaction.set_rollback(True)
+
+    def benchmark(self, n, repeat):
+        results = {}
+        window = connection.features.supports_over_clause
+        for name, fn in self.IMPLEMENTATIONS:
+            if name == 'window' and not window:
+                name += ' (fallback)'
+            times = []
+            for i in range(repeat):
+                t = time.perf_counter()
+                rows = fn(n)
+                times.append(time.perf_counter() - t)
+            results[name] = {tt_id: round(d, 6) for tt_id, d in rows}
+            self.stdout.write('%2d legs %-18s %8.3f s (%d rows)' % (
+                n, name, min(times), len(rows)))
+        expected = results.pop('aggregate')
+        for name, rows in results.items():
+            if rows != expected:
+                raise CommandError(
+                    '%s returned a different result than aggregate' % name)
@@ -0,0 +1,83 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from stopwatch.models import TimeTrial, PersonalBest, get_season
+from iou.models import Expence
+
+
+def hot_queries():
+    """Return (description, queryset, index name) of the queries on
+    TimeTrial, PersonalBest and Expence made by the busiest pages."""
+    now = timezone.now()
+    threshold = now - datetime.timedelta(hours=1)
+    return [
+        ('Live TimeTrials (Home.get_live, TimeTrialList)',
+         TimeTrial.objects.filter(result='', start_time__gt=threshold),
+         'timetrial_result_start_idx'),
+        ('Previous personal best (get_time_attack)',
+         TimeTrial.objects.filter(
+             created_time__lt=now, result='f', profile_id=0,
+             leg_count=5).order_by('duration'),
+         'timetrial_profile_result_idx'),
+        ('Previous kasse i kass (get_time_attack)',
+         TimeTrial.objects.filter(
+             created_time__lt=now, is_kasse_i_kass=True).order_by(
+                 '-start_time'),
+         'timetrial_kasse_created_idx'),
+        ('A page of TimeTrials (TimeTrialList)',
+         TimeTrial.objects.exclude(result='').filter(
+             start_time__lt=now).order_by('-start_time', '-pk')[:101],
+         'timetrial_start_idx'),
+        ('A page of TimeTrials of a profile (ProfileView)',
+         TimeTrial.objects.filter(profile_id=0, start_time__lt=now).order_by(
+             '-start_time', '-pk')[:101],
+         'timetrial_profile_start_idx'),
+        ('Best times of the season (Home.get_current_best)',
+         PersonalBest.objects.filter(
+             prefix=False, leg_count=5, season=get_season(now)),
+         'personalbest_rank_idx'),
+        ('Best times (TimeTrialBest)',
+         PersonalBest.objects.filter(prefix=False, season=None),
+         'personalbest_rank_idx'),
+        ('Expences in a date range (ExpenceList)',
+         Expence.raw_objects.filter(
+             created_time__gte=threshold, created_time__lt=now).order_by(
+                 '-pk')[:50],
+         'expence_created_idx'),
+        ('Expences of an association in a date range (ExpenceList)',
+         Expence.raw_objects.filter(
+             payer__association_id=0, created_time__gte=threshold,
+             created_time__lt=now).order_by('-pk')[:50],
+         'expence_payer_created_idx'),
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Check that the hot queries use their indexes, ' +
+            'using EXPLAIN on SQLite or PostgreSQL.')
+
+    def handle(self, *args, **options):
+        verbose = options['verbosity'] >= 2
+        errors = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Small tables are scanned sequentially regardless of
+                # indexes, so check that the indexes can be used at all.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for description, qs, index in hot_queries():
+                plan = qs.explain()
+                if verbose:
+                    self.stdout.write('%s:\n%s\n' % (description, plan))
+                if index not in plan:
+                    errors.append('%s does not use %s' % (description, index))
+                elif options['verbosity'] >= 1:
+                    self.stdout.write('%s uses %s' % (description, index))
+        if errors:
+            raise CommandError('\n'.join(errors))
@@ -0,0 +1,171 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from stopwatch.models import (
+    TimeTrial, Leg, PersonalBest, ProfileStats, compute_personal_bests,
+    compute_profile_stats, iter_cumulative_durations,
+)
+
+
+class Command(BaseCommand):
+    help = ('Recompute the leg summary stored on each TimeTrial ' +
+            '(leg_count, duration, season, stop_time and last_activity), ' +
+            'the cumulative durations of each Leg, ' +
+            'the PersonalBest leaderboard and the ProfileStats.')
+
+    SUMMARY_FIELDS = ('leg_count', 'duration', 'season', 'stop_time',
+                      'last_activity')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report data that is out of date')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.verify = options['verify']
+        self.quiet = options['verbosity'] == 0
+        self.verbose = options['verbosity'] >= 2 or self.verify
+        self.batch_size = options['batch_size']
+        errors = []
+        errors += self.refresh_summaries()
+        errors += self.refresh_legs()
+        errors += self.refresh_personal_bests()
+        errors += self.refresh_profile_stats()
+        if errors:
+            raise CommandError('\n'.join(errors))
+        if self.verify:
+            self.stdout.write('Everything is up to date')
+
+    def refresh_summaries(self):
+        legs = {}
+        leg_qs = Leg.raw_objects.order_by('timetrial_id', 'order')
+        leg_qs = leg_qs.values_list('timetrial_id', 'duration')
+        for tt_id, duration in leg_qs.iterator():
+            legs.setdefault(tt_id, []).append(duration)
+
+        stale = []
+        for tt in TimeTrial.raw_objects.order_by('pk').iterator():
+            old = [getattr(tt, f) for f in self.SUMMARY_FIELDS]
+            tt.set_leg_summary(legs.get(tt.pk, []))
+            new = [getattr(tt, f) for f in self.SUMMARY_FIELDS]
+            if old != new:
+                stale.append(tt)
+                if self.verbose:
+                    self.stdout.write('%s: %r != %r' % (tt.pk, old, new))
+
+        if self.verify:
+            if stale:
+                return ['%d TimeTrial(s) have an out of date summary' %
+                        len(stale)]
+            return []
+
+        with transaction.atomic():
+            TimeTrial.raw_objects.bulk_update(
+                stale, self.SUMMARY_FIELDS, batch_size=self.batch_size)
+        if not self.quiet:
+            self.stdout.write('Updated %d TimeTrial(s)' % len(stale))
+        return []
+
+    def refresh_legs(self):
+        start_times = dict(
+            TimeTrial.raw_objects.values_list('pk', 'start_time'))
+        current = {}
+        leg_qs = Leg.raw_objects.values_list(
+            'pk', 'cumulative_duration', 'time')
+        for pk, cumulative_duration, time in leg_qs.iterator():
+            current[pk] = (cumulative_duration, time)
+        stale = []
+        rows = iter_cumulative_durations(Leg.raw_objects.all())
+        for pk, tt_id, order, cumulative_duration in rows:
+            leg = Leg(pk=pk, timetrial_id=tt_id,
+                      cumulative_duration=cumulative_duration)
+            leg.update_time(start_times[tt_id])
+            if current[pk] != (leg.cumulative_duration, leg.time):
+                stale.append(leg)
+                if self.verbose:
+                    self.stdout.write('Leg %s: %r != %r' % (
+                        pk, current[pk], (leg.cumulative_duration, leg.time)))
+
+        if self.verify:
+            if stale:
+                return ['%d Leg(s) have an out of date cumulative duration' %
+                        len(stale)]
+            return []
+
+        with transaction.atomic():
+            Leg.raw_objects.bulk_update(
+                stale, ('cumulative_duration', 'time'),
+                batch_size=self.batch_size)
+        if not self.quiet:
+            self.stdout.write('Updated %d Leg(s)' % len(stale))
+        return []
+
+    def refresh_personal_bests(self):
+        def key(pb):
+            return (pb.profile_id, pb.leg_count, pb.prefix, pb.season,
+                    pb.timetrial_id, pb.duration)
+
+        profile_ids = TimeTrial.raw_objects.order_by('profile_id')
+        profile_ids = list(
+            profile_ids.values_list('profile_id', flat=True).distinct())
+        expected = []
+        for i in range(0, len(profile_ids), self.batch_size):
+            expected += compute_personal_bests(
+                profile_ids[i:i + self.batch_size])
+
+        if self.verify:
+            existing = set(map(key, PersonalBest.raw_objects.all()))
+            wrong = existing.symmetric_difference(map(key, expected))
+            if self.verbose:
+                for row in sorted(wrong, key=str):
+                    self.stdout.write('PersonalBest %r' % (row,))
+            if wrong:
+                return ['%d PersonalBest row(s) are out of date' %
+                        len(wrong)]
+            return []
+
+        with transaction.atomic():
+            PersonalBest.raw_objects.all().delete()
+            PersonalBest.raw_objects.bulk_create(
+                expected, batch_size=self.batch_size)
+        if not self.quiet:
+            self.stdout.write(
+                'Created %d PersonalBest row(s)' % len(expected))
+        return []
+
+    def refresh_profile_stats(self):
+        def key(s):
+            return (s.profile_id, s.timetrial_count, s.attempt_count,
+                    s.leg_count, s.last_activity, s.leg_count_stats_json)
+
+        profile_ids = TimeTrial.raw_objects.order_by('profile_id')
+        profile_ids = list(
+            profile_ids.values_list('profile_id', flat=True).distinct())
+        expected = []
+        for i in range(0, len(profile_ids), self.batch_size):
+            expected += compute_profile_stats(
+                profile_ids[i:i + self.batch_size])
+
+        if self.verify:
+            existing = set(map(key, ProfileStats.objects.all()))
+            wrong = existing.symmetric_difference(map(key, expected))
+            if self.verbose:
+                for row in sorted(wrong, key=str):
+                    self.stdout.write('ProfileStats %r' % (row,))
+            if wrong:
+                return ['%d ProfileStats row(s) are out of date' %
+                        len(wrong)]
+            return []
+
+        with transaction.atomic():
+            ProfileStats.objects.all().delete()
+            ProfileStats.objects.bulk_create(
+                expected, batch_size=self.batch_size)
+        if not self.quiet:
+            self.stdout.write(
+                'Created %d ProfileStats row(s)' % len(expected))
+        return []
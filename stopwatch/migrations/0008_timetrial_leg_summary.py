@@ -0,0 +1,66 @@
+# Generated by Django 2.2.3 on 2026-10-18 14:13
+
+import datetime
+
+from django.db import migrations, models
+
+
+def set_leg_summary(apps, schema_editor):
+    TimeTrial = apps.get_model('stopwatch', 'TimeTrial')
+    Leg = apps.get_model('stopwatch', 'Leg')
+    legs = {}
+    leg_qs = Leg.objects.order_by('timetrial_id', 'order')
+    for tt_id, duration in leg_qs.values_list('timetrial_id', 'duration'):
+        legs.setdefault(tt_id, []).append(duration)
+    for tt in TimeTrial.objects.all():
+        durations = legs.get(tt.pk, [])
+        tt.leg_count = len(durations)
+        tt.duration = sum(durations) if durations else None
+        if tt.start_time is None or tt.duration is None:
+            tt.stop_time = None
+        else:
+            tt.stop_time = (
+                tt.start_time + datetime.timedelta(seconds=tt.duration))
+        if tt.leg_count > 0:
+            tt.last_activity = tt.stop_time
+        elif tt.start_time is None:
+            tt.last_activity = tt.created_time
+        else:
+            tt.last_activity = tt.start_time
+        tt.save(update_fields=[
+            'leg_count', 'duration', 'stop_time', 'last_activity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stopwatch', '0007_timetrial_is_kasse_i_kass'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timetrial',
+            name='duration',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='timetrial',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='timetrial',
+            name='leg_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='timetrial',
+            name='stop_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='timetrial',
+            index=models.Index(fields=['result', 'leg_count', 'duration'], name='timetrial_best_idx'),
+        ),
+        migrations.RunPython(set_leg_summary, migrations.RunPython.noop),
+    ]
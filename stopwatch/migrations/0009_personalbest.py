@@ -0,0 +1,74 @@
+# Generated by Django 2.2.3 on 2026-10-18 14:15
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def add_personal_bests(apps, schema_editor):
+    TimeTrial = apps.get_model('stopwatch', 'TimeTrial')
+    Leg = apps.get_model('stopwatch', 'Leg')
+    PersonalBest = apps.get_model('stopwatch', 'PersonalBest')
+
+    legs = {}
+    leg_qs = Leg.objects.filter(timetrial__result='f')
+    leg_qs = leg_qs.order_by('timetrial_id', 'order')
+    for tt_id, duration in leg_qs.values_list('timetrial_id', 'duration'):
+        legs.setdefault(tt_id, []).append(duration)
+
+    best = {}
+    qs = TimeTrial.objects.filter(result='f').order_by('start_time', 'pk')
+    for tt_id, profile_id, start_time in qs.values_list(
+            'pk', 'profile_id', 'start_time'):
+        seasons = [None]
+        if start_time is not None:
+            dt = timezone.localtime(start_time)
+            seasons.append(dt.year if dt.month >= 9 else dt.year - 1)
+        candidates = []
+        prefix_sum = 0
+        for i, d in enumerate(legs.get(tt_id, ())):
+            prefix_sum += d
+            if prefix_sum > 0:
+                candidates.append((i + 1, True, prefix_sum))
+        if tt_id in legs:
+            candidates.append((len(legs[tt_id]), False, prefix_sum))
+        for leg_count, prefix, duration in candidates:
+            for season in seasons:
+                key = (profile_id, leg_count, prefix, season)
+                if key not in best or duration < best[key].duration:
+                    best[key] = PersonalBest(
+                        profile_id=profile_id, timetrial_id=tt_id,
+                        leg_count=leg_count, prefix=prefix,
+                        season=season, duration=duration)
+    PersonalBest.objects.bulk_create(best.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kasse', '0011_profile_preferences_json'),
+        ('stopwatch', '0008_timetrial_leg_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalBest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('leg_count', models.PositiveIntegerField()),
+                ('prefix', models.BooleanField(default=False)),
+                ('season', models.IntegerField(blank=True, null=True)),
+                ('duration', models.FloatField()),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='kasse.Profile')),
+                ('timetrial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='stopwatch.TimeTrial')),
+            ],
+            options={
+                'ordering': ['duration'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='personalbest',
+            index=models.Index(fields=['prefix', 'leg_count', 'season', 'duration'], name='personalbest_rank_idx'),
+        ),
+        migrations.RunPython(add_personal_bests, migrations.RunPython.noop),
+    ]
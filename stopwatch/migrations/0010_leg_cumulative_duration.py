@@ -0,0 +1,52 @@
+# Generated by Django 2.2.3 on 2026-10-18 14:17
+
+import datetime
+
+from django.db import migrations, models
+
+
+def set_cumulative_durations(apps, schema_editor):
+    TimeTrial = apps.get_model('stopwatch', 'TimeTrial')
+    Leg = apps.get_model('stopwatch', 'Leg')
+    start_times = dict(TimeTrial.objects.values_list('pk', 'start_time'))
+    legs = []
+    tt_id = cumulative_duration = None
+    for leg in Leg.objects.order_by('timetrial_id', 'order').iterator():
+        if leg.timetrial_id != tt_id:
+            tt_id = leg.timetrial_id
+            cumulative_duration = 0
+        cumulative_duration += leg.duration
+        leg.cumulative_duration = cumulative_duration
+        start_time = start_times[tt_id]
+        if start_time is not None:
+            leg.time = start_time + datetime.timedelta(
+                seconds=cumulative_duration)
+        legs.append(leg)
+    Leg.objects.bulk_update(
+        legs, ['cumulative_duration', 'time'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stopwatch', '0009_personalbest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leg',
+            name='cumulative_duration',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='leg',
+            name='time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='leg',
+            index=models.Index(fields=['timetrial', 'order'], name='leg_timetrial_order_idx'),
+        ),
+        migrations.RunPython(set_cumulative_durations,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.2.3 on 2026-10-18 14:22
+
+from django.db import migrations, models
+from django.db.models import Q, Sum, Count, Max, Avg
+import django.db.models.deletion
+import json
+
+
+def add_profile_stats(apps, schema_editor):
+    TimeTrial = apps.get_model('stopwatch', 'TimeTrial')
+    PersonalBest = apps.get_model('stopwatch', 'PersonalBest')
+    ProfileStats = apps.get_model('stopwatch', 'ProfileStats')
+
+    best = {}
+    best_qs = PersonalBest.objects.filter(prefix=False, season=None)
+    for profile_id, leg_count, tt_id, duration in best_qs.values_list(
+            'profile_id', 'leg_count', 'timetrial_id', 'duration'):
+        best[profile_id, leg_count] = (tt_id, duration)
+
+    leg_count_stats = {}
+    qs = TimeTrial.objects.filter(result='f', duration__isnull=False)
+    qs = qs.order_by('profile_id', 'leg_count')
+    qs = qs.values('profile_id', 'leg_count')
+    qs = qs.annotate(attempts=Count('pk'), average=Avg('duration'))
+    for row in qs:
+        profile_id = row.pop('profile_id')
+        row['best_id'], row['best_duration'] = best.get(
+            (profile_id, row['leg_count']), (None, None))
+        leg_count_stats.setdefault(profile_id, []).append(row)
+
+    attempt = ~Q(result='')
+    qs = TimeTrial.objects.order_by('profile_id').values('profile_id')
+    qs = qs.annotate(
+        timetrial_count=Count('pk'),
+        attempt_count=Count('pk', filter=attempt),
+        leg_count=Sum('leg_count', filter=attempt),
+        last_activity=Max('last_activity'))
+    stats = []
+    for row in qs:
+        row['leg_count'] = row['leg_count'] or 0
+        row['leg_count_stats_json'] = json.dumps(
+            leg_count_stats.get(row['profile_id'], []))
+        stats.append(ProfileStats(**row))
+    ProfileStats.objects.bulk_create(stats, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kasse', '0011_profile_preferences_json'),
+        ('stopwatch', '0010_leg_cumulative_duration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileStats',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='timetrial_stats', serialize=False, to='kasse.Profile')),
+                ('timetrial_count', models.PositiveIntegerField(default=0)),
+                ('attempt_count', models.PositiveIntegerField(default=0)),
+                ('leg_count', models.PositiveIntegerField(default=0)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+                ('leg_count_stats_json', models.TextField(default='[]')),
+            ],
+        ),
+        migrations.RunPython(add_profile_stats, migrations.RunPython.noop),
+    ]
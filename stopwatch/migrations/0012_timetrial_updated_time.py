@@ -0,0 +1,28 @@
+# Generated by Django 2.2.3 on 2026-10-18 14:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def set_updated_time(apps, schema_editor):
+    TimeTrial = apps.get_model('stopwatch', 'TimeTrial')
+    TimeTrial.objects.update(updated_time=models.F('created_time'))
+    TimeTrial.objects.filter(
+        last_activity__gt=models.F('created_time')).update(
+            updated_time=models.F('last_activity'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stopwatch', '0011_profilestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timetrial',
+            name='updated_time',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(set_updated_time, migrations.RunPython.noop),
+    ]
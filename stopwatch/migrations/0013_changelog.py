@@ -0,0 +1,54 @@
+# Generated by Django 2.2.3 on 2026-10-18 14:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def log_existing_timetrials(apps, schema_editor):
+    # Log every existing TimeTrial as inserted, so that fetching the
+    # changes since revision 0 returns all TimeTrials.
+    TimeTrial = apps.get_model('stopwatch', 'TimeTrial')
+    Leg = apps.get_model('stopwatch', 'Leg')
+    ChangeLog = apps.get_model('stopwatch', 'ChangeLog')
+    ChangeLog.objects.bulk_create(
+        [ChangeLog(timetrial_id=pk, action='insert')
+         for pk in TimeTrial.objects.order_by('pk').values_list(
+             'pk', flat=True)],
+        batch_size=500)
+    TimeTrial.objects.update(revision=models.Subquery(
+        ChangeLog.objects.filter(
+            timetrial_id=models.OuterRef('pk')).values('pk')[:1]))
+    Leg.objects.update(revision=models.Subquery(
+        TimeTrial.objects.filter(
+            pk=models.OuterRef('timetrial_id')).values('revision')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stopwatch', '0012_timetrial_updated_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timetrial_id', models.IntegerField()),
+                ('action', models.CharField(choices=[('insert', 'Insert'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('time', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='leg',
+            name='revision',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='timetrial',
+            name='revision',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(
+            log_existing_timetrials, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.2.3 on 2026-10-18 14:45
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def get_season(dt):
+    # A copy of stopwatch.models.get_season as it was when this
+    # migration was written.
+    dt = timezone.localtime(dt)
+    return dt.year if dt.month >= 9 else dt.year - 1
+
+
+def set_season(apps, schema_editor):
+    TimeTrial = apps.get_model('stopwatch', 'TimeTrial')
+    timetrials = list(
+        TimeTrial.objects.exclude(start_time=None).only('start_time'))
+    for tt in timetrials:
+        tt.season = get_season(tt.start_time)
+    TimeTrial.objects.bulk_update(timetrials, ['season'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stopwatch', '0013_changelog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timetrial',
+            name='season',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(set_season, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='timetrial',
+            index=models.Index(fields=['result', 'start_time'], name='timetrial_result_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timetrial',
+            index=models.Index(fields=['profile', 'result', 'created_time'], name='timetrial_profile_result_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timetrial',
+            index=models.Index(fields=['is_kasse_i_kass', 'created_time'], name='timetrial_kasse_created_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.3 on 2026-10-18 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stopwatch', '0014_timetrial_season_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timetrial',
+            index=models.Index(fields=['start_time', 'id'], name='timetrial_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timetrial',
+            index=models.Index(fields=['profile', 'start_time', 'id'], name='timetrial_profile_start_idx'),
+        ),
+    ]
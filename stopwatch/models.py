@@ -2,18 +2,36 @@
 from __future__ import absolute_import, unicode_literals, division
 
 import json
+import datetime
 
 from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django.utils.encoding import python_2_unicode_compatible
-from django.db import models, OperationalError
-from django.db.models import Sum
+from django.utils import timezone
+from django.utils.six.moves import zip_longest
+from django.dispatch import Signal
+from django.db import models, connection, transaction, OperationalError
+from django.db.models import F, Q, Sum, Count, Max, Avg, Window, RowRange
 
 from kasse.models import Profile
+from kasse.utils import on_commit_batch
+from kasse.versions import bump_version_on_commit
 
-from stopwatch.managers import (
-    TimeTrialManager, LegManager,
-)
+from stopwatch.managers import TimeTrialManager, PersonalBestManager
+
+
+# Sent by TimeTrial.set_legs when the legs of a TimeTrial have changed,
+# since bulk_create and bulk_update do not send post_save.
+legs_changed = Signal(providing_args=['instance'])
+
+
+def get_season(dt):
+    """Return the year in which the season containing dt started.
+
+    A season starts on September 1st.
+    """
+    dt = timezone.localtime(dt)
+    return dt.year if dt.month >= 9 else dt.year - 1
 
 
 @python_2_unicode_compatible
@@ -21,13 +39,6 @@ class TimeTrial(models.Model):
     objects = TimeTrialManager()
     raw_objects = models.Manager()
 
-    @classmethod
-    def leg_prefix(cls, n):
-        qs = cls.raw_objects.filter(leg__order__lt=n + 1)
-        qs = TimeTrialManager.process_queryset(qs).filter(leg_count=n)
-        qs = qs.filter(duration__gt=0)
-        return qs
-
     RESULTS = (
         ('f', 'Finished'),
         ('irr', 'Not accepted'),  # not accepted / irregular result
@@ -58,6 +69,24 @@ class TimeTrial(models.Model):
 
     is_kasse_i_kass = models.BooleanField(default=False)
 
+    # Time of the latest change to the TimeTrial or its legs,
+    # used by clients of the JSON export to fetch only what changed.
+    updated_time = models.DateTimeField(
+        default=timezone.now, db_index=True, editable=False)
+    # ChangeLog revision of the latest change to the TimeTrial or its legs.
+    revision = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+
+    # get_season(start_time), maintained by save.
+    season = models.IntegerField(null=True, blank=True, editable=False)
+
+    # Summary of the legs, maintained by set_legs and save.
+    leg_count = models.PositiveIntegerField(default=0, editable=False)
+    duration = models.FloatField(null=True, blank=True, editable=False)
+    stop_time = models.DateTimeField(null=True, blank=True, editable=False)
+    last_activity = models.DateTimeField(
+        null=True, blank=True, editable=False)
+
     def parse_possible_laps(self):
         if not self.possible_laps:
             return []
@@ -88,28 +117,109 @@ class TimeTrial(models.Model):
             return self.result
 
     def get_duration_display(self):
-        try:
-            d = self.duration
-        except AttributeError:
-            d = self.compute_duration()
+        d = self.duration
         if d is None:
             return 'None'
         else:
             minutes, seconds = divmod(d, 60)
             return '%d:%05.2f' % (minutes, seconds)
 
-    def compute_duration(self):
-        return self.leg_set.all().aggregate(d=Sum('duration'))['d']
-
     def clean(self):
         pass
 
+    def get_durations(self):
+        qs = Leg.raw_objects.filter(timetrial=self).order_by('order')
+        return list(qs.values_list('duration', flat=True))
+
+    def set_leg_summary(self, durations):
+        self.leg_count = len(durations)
+        self.duration = sum(durations) if durations else None
+        self.update_activity()
+
+    def update_activity(self):
+        if self.start_time is None:
+            self.season = None
+        else:
+            self.season = get_season(self.start_time)
+        if self.start_time is None or self.duration is None:
+            self.stop_time = None
+        else:
+            self.stop_time = (
+                self.start_time + datetime.timedelta(seconds=self.duration))
+        if self.leg_count > 0:
+            self.last_activity = self.stop_time
+        elif self.start_time is None:
+            self.last_activity = self.created_time
+        else:
+            self.last_activity = self.start_time
+
+    def save_leg_summary(self):
+        self.updated_time = timezone.now()
+        TimeTrial.raw_objects.filter(pk=self.pk).update(
+            leg_count=self.leg_count,
+            duration=self.duration,
+            stop_time=self.stop_time,
+            last_activity=self.last_activity,
+            updated_time=self.updated_time,
+        )
+
+    def make_legs(self, durations):
+        legs = []
+        cumulative_duration = 0
+        for i, d in enumerate(durations):
+            cumulative_duration += d
+            leg = Leg(timetrial=self, duration=d, order=i + 1,
+                      cumulative_duration=cumulative_duration)
+            leg.update_time(self.start_time)
+            legs.append(leg)
+        return legs
+
     def set_legs(self, durations):
-        legs = [Leg(timetrial=self, duration=d, order=i + 1)
-                for i, d in enumerate(durations)]
-        self.leg_set.all().delete()
-        for l in legs:
-            l.save()
+        """Store the legs with the given durations.
+
+        Only the legs that differ from the stored legs are written,
+        so appending a leg only inserts that leg.
+        """
+        legs = self.make_legs(durations)
+        fields = ('order', 'duration', 'cumulative_duration', 'time')
+        created = []
+        changed = []
+        deleted = []
+        with transaction.atomic():
+            existing = Leg.raw_objects.filter(timetrial=self).order_by('order')
+            for leg, old in zip_longest(legs, existing):
+                if old is None:
+                    created.append(leg)
+                elif leg is None:
+                    deleted.append(old.pk)
+                else:
+                    leg.pk = old.pk
+                    if any(getattr(leg, f) != getattr(old, f)
+                           for f in fields):
+                        changed.append(leg)
+            if deleted:
+                Leg.raw_objects.filter(pk__in=deleted).delete()
+            if changed:
+                # Also clear revision to have it set by the ChangeLog.
+                Leg.raw_objects.bulk_update(changed, fields + ('revision',))
+            if created:
+                Leg.raw_objects.bulk_create(created)
+
+            summary_fields = (
+                'leg_count', 'duration', 'stop_time', 'last_activity')
+            old_summary = [getattr(self, f) for f in summary_fields]
+            self.set_leg_summary(durations)
+            legs_have_changed = bool(created or changed or deleted)
+            if (legs_have_changed or
+                    old_summary != [getattr(self, f) for f in summary_fields]):
+                self.save_leg_summary()
+            if legs_have_changed:
+                legs_changed.send(sender=TimeTrial, instance=self)
+
+    def refresh_legs(self):
+        """Recompute the legs and summary after the legs or start_time
+        have been changed without going through set_legs."""
+        self.set_legs(self.get_durations())
 
     def __str__(self):
         if self.result == '':
@@ -122,9 +232,21 @@ class TimeTrial(models.Model):
     def get_absolute_url(self):
         return reverse('timetrial_detail', kwargs={'pk': self.pk})
 
-    def save_robust(self):
+    def save(self, *args, **kwargs):
+        self.update_activity()
+        self.updated_time = timezone.now()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = (
+                list(kwargs['update_fields']) +
+                ['season', 'stop_time', 'last_activity', 'updated_time'])
+        super(TimeTrial, self).save(*args, **kwargs)
+
+    def save_robust(self, update_fields=None):
         try:
-            self.save()
+            # In a savepoint, so the transaction of the caller can
+            # still be used for the fallback if the save fails.
+            with transaction.atomic():
+                self.save(update_fields=update_fields)
         except OperationalError:
             # Work around bug in SQLite
             # Related to: https://code.djangoproject.com/ticket/18580
@@ -139,31 +261,376 @@ class TimeTrial(models.Model):
                 created_time=self.created_time,
                 beverage=self.beverage,
                 possible_laps=self.possible_laps,
+                season=self.season,
+                stop_time=self.stop_time,
+                last_activity=self.last_activity,
+                updated_time=self.updated_time,
             )
+            # The update does not send post_save.
+            refresh_profile_stats_on_commit(profile_ids=[
+                getattr(self, 'previous_profile_id', None), self.profile_id])
+            log_change_on_commit(self.pk, 'update')
 
     class Meta:
         ordering = ['-created_time']
+        indexes = [
+            models.Index(fields=['result', 'leg_count', 'duration'],
+                         name='timetrial_best_idx'),
+            # Live TimeTrials (Home.get_live, TimeTrialList)
+            models.Index(fields=['result', 'start_time'],
+                         name='timetrial_result_start_idx'),
+            # Previous personal best (get_time_attack)
+            models.Index(fields=['profile', 'result', 'created_time'],
+                         name='timetrial_profile_result_idx'),
+            # Previous kasse i kass (get_time_attack)
+            models.Index(fields=['is_kasse_i_kass', 'created_time'],
+                         name='timetrial_kasse_created_idx'),
+            # Pages of TimeTrialList and ProfileView (stopwatch.pagination)
+            models.Index(fields=['start_time', 'id'],
+                         name='timetrial_start_idx'),
+            models.Index(fields=['profile', 'start_time', 'id'],
+                         name='timetrial_profile_start_idx'),
+        ]
 
 
 @python_2_unicode_compatible
 class Leg(models.Model):
-    objects = LegManager()
+    objects = models.Manager()
     raw_objects = models.Manager()
 
     timetrial = models.ForeignKey(TimeTrial, on_delete=models.CASCADE)
     duration = models.FloatField()
     order = models.PositiveIntegerField(default=0)
 
+    # Sum of the durations of this and the preceding legs,
+    # and the time at which this leg was finished.
+    # Maintained by TimeTrial.set_legs.
+    cumulative_duration = models.FloatField(default=0, editable=False)
+    time = models.DateTimeField(null=True, blank=True, editable=False)
+    # ChangeLog revision of the latest change to the leg. A changed leg
+    # has None until the ChangeLog entry is written after the commit.
+    revision = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.revision = None
+        super(Leg, self).save(*args, **kwargs)
+
+    def update_time(self, start_time):
+        if start_time is None:
+            self.time = None
+        else:
+            self.time = start_time + datetime.timedelta(
+                seconds=self.cumulative_duration)
+
     def __str__(self):
         return str(self.duration)
 
     class Meta:
         ordering = ['timetrial', 'order']
+        indexes = [
+            models.Index(fields=['timetrial', 'order'],
+                         name='leg_timetrial_order_idx'),
+        ]
+
+
+def iter_cumulative_durations(leg_qs):
+    """Yield (pk, timetrial_id, order, cumulative duration) for each Leg.
+
+    The cumulative durations are computed from Leg.duration
+    (not the stored Leg.cumulative_duration) using a window function
+    if the database supports it, and in Python otherwise.
+    The queryset must contain all legs of each TimeTrial up to the
+    highest order that is needed.
+    """
+    leg_qs = leg_qs.order_by('timetrial_id', 'order')
+    if connection.features.supports_over_clause:
+        running_duration = Window(
+            Sum('duration'),
+            partition_by=[F('timetrial_id')],
+            order_by=F('order').asc(),
+            frame=RowRange(start=None, end=0))
+        leg_qs = leg_qs.annotate(running_duration=running_duration)
+        leg_qs = leg_qs.values_list(
+            'pk', 'timetrial_id', 'order', 'running_duration')
+        for row in leg_qs.iterator():
+            yield row
+        return
+
+    leg_qs = leg_qs.values_list('pk', 'timetrial_id', 'order', 'duration')
+    tt_id = cumulative_duration = None
+    for pk, timetrial_id, order, duration in leg_qs.iterator():
+        if timetrial_id != tt_id:
+            tt_id = timetrial_id
+            cumulative_duration = 0
+        cumulative_duration += duration
+        yield pk, timetrial_id, order, cumulative_duration
+
+
+@python_2_unicode_compatible
+class PersonalBest(models.Model):
+    """The best finished TimeTrial of a profile for a number of legs.
+
+    If prefix is False, the row is for TimeTrials with exactly leg_count
+    legs; otherwise it is for the first leg_count legs of any TimeTrial.
+    season is the season as returned by get_season,
+    or None for the all-time records.
+
+    The rows of a profile are replaced by update_personal_bests.
+    """
+
+    objects = PersonalBestManager()
+    raw_objects = models.Manager()
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    timetrial = models.ForeignKey(TimeTrial, on_delete=models.CASCADE)
+    leg_count = models.PositiveIntegerField()
+    prefix = models.BooleanField(default=False)
+    season = models.IntegerField(null=True, blank=True)
+    duration = models.FloatField()
+
+    def __str__(self):
+        return '%s%s %s: %s' % (
+            self.leg_count, '+' if self.prefix else '',
+            self.season or 'all-time', self.timetrial_id)
+
+    class Meta:
+        ordering = ['duration']
+        indexes = [
+            models.Index(fields=['prefix', 'leg_count', 'season', 'duration'],
+                         name='personalbest_rank_idx'),
+        ]
+
+
+def compute_personal_bests(profile_ids):
+    """Compute (unsaved) PersonalBest rows for the given profiles."""
+    qs = TimeTrial.raw_objects.filter(profile_id__in=profile_ids, result='f')
+    qs = qs.order_by('start_time', 'pk')
+    timetrials = list(qs.values_list('pk', 'profile_id', 'season'))
+    leg_qs = Leg.raw_objects.filter(
+        timetrial__profile_id__in=profile_ids, timetrial__result='f')
+    leg_qs = leg_qs.order_by('timetrial_id', 'order')
+    legs = {}
+    for tt_id, duration in leg_qs.values_list('timetrial_id', 'duration'):
+        legs.setdefault(tt_id, []).append(duration)
+
+    best = {}
+    for tt_id, profile_id, season in timetrials:
+        seasons = [None] if season is None else [None, season]
+        candidates = []
+        prefix_sum = 0
+        for i, d in enumerate(legs.get(tt_id, ())):
+            prefix_sum += d
+            if prefix_sum > 0:
+                candidates.append((i + 1, True, prefix_sum))
+        if tt_id in legs:
+            candidates.append((len(legs[tt_id]), False, prefix_sum))
+        for leg_count, prefix, duration in candidates:
+            for season in seasons:
+                key = (profile_id, leg_count, prefix, season)
+                if key not in best or duration < best[key].duration:
+                    best[key] = PersonalBest(
+                        profile_id=profile_id, timetrial_id=tt_id,
+                        leg_count=leg_count, prefix=prefix,
+                        season=season, duration=duration)
+    return list(best.values())
+
+
+def update_personal_bests(profile_ids):
+    """Replace the PersonalBest rows of the given profiles.
+
+    Called by refresh_profile_stats whenever a TimeTrial of one of the
+    profiles is created, changed or deleted.
+    """
+    profile_ids = [i for i in set(profile_ids) if i is not None]
+    with transaction.atomic():
+        PersonalBest.objects.filter(profile_id__in=profile_ids).delete()
+        PersonalBest.objects.bulk_create(compute_personal_bests(profile_ids))
+
+
+@python_2_unicode_compatible
+class ProfileStats(models.Model):
+    """Cached TimeTrial statistics of a profile.
+
+    attempt_count, leg_count and last_activity only include TimeTrials
+    with a result, so the rows only change when a TimeTrial is created,
+    finished, edited or deleted, and not on each live update.
+    leg_count_stats_json has an entry for each number of legs in a finished
+    TimeTrial of the profile with the number of attempts, the average
+    duration and the all-time PersonalBest.
+
+    The rows of a profile are replaced by refresh_profile_stats, which is
+    called from the signal handlers in stopwatch.signals.
+    """
+
+    profile = models.OneToOneField(
+        Profile, on_delete=models.CASCADE, primary_key=True,
+        related_name='timetrial_stats')
+    timetrial_count = models.PositiveIntegerField(default=0)
+    attempt_count = models.PositiveIntegerField(default=0)
+    leg_count = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField(null=True, blank=True)
+    leg_count_stats_json = models.TextField(default='[]')
+
+    def get_leg_count_stats(self):
+        return json.loads(self.leg_count_stats_json)
+
+    def __str__(self):
+        return '%s: %s attempts, %s legs' % (
+            self.profile_id, self.attempt_count, self.leg_count)
+
+
+def compute_profile_stats(profile_ids):
+    """Compute (unsaved) ProfileStats rows for the given profiles.
+
+    The PersonalBest rows of the profiles must be up to date.
+    """
+    attempt = ~Q(result='')
+    qs = TimeTrial.raw_objects.filter(profile_id__in=profile_ids)
+    qs = qs.order_by('profile_id').values('profile_id')
+    qs = qs.annotate(
+        timetrial_count=Count('pk'),
+        attempt_count=Count('pk', filter=attempt),
+        leg_count=Sum('leg_count', filter=attempt),
+        last_activity=Max('last_activity', filter=attempt))
+    stats = {}
+    for row in qs:
+        row['leg_count'] = row['leg_count'] or 0
+        stats[row['profile_id']] = ProfileStats(**row)
+
+    best_qs = PersonalBest.raw_objects.filter(
+        profile_id__in=profile_ids, prefix=False, season=None)
+    best_qs = best_qs.values_list(
+        'profile_id', 'leg_count', 'timetrial_id', 'duration')
+    best = {(p, n): (tt_id, d) for p, n, tt_id, d in best_qs}
+    qs = TimeTrial.raw_objects.filter(
+        profile_id__in=profile_ids, result='f', duration__isnull=False)
+    qs = qs.order_by('profile_id', 'leg_count')
+    qs = qs.values('profile_id', 'leg_count')
+    qs = qs.annotate(attempts=Count('pk'), average=Avg('duration'))
+    leg_count_stats = {}
+    for row in qs:
+        profile_id = row.pop('profile_id')
+        row['best_id'], row['best_duration'] = best.get(
+            (profile_id, row['leg_count']), (None, None))
+        leg_count_stats.setdefault(profile_id, []).append(row)
+    for profile_id, s in stats.items():
+        s.leg_count_stats_json = json.dumps(
+            leg_count_stats.get(profile_id, []))
+    return list(stats.values())
+
+
+def refresh_profile_stats(profile_ids):
+    """Replace the PersonalBest and ProfileStats rows of the profiles."""
+    profile_ids = [i for i in set(profile_ids) if i is not None]
+    with transaction.atomic():
+        update_personal_bests(profile_ids)
+        ProfileStats.objects.filter(profile_id__in=profile_ids).delete()
+        ProfileStats.objects.bulk_create(compute_profile_stats(profile_ids))
+        bump_version_on_commit('timetrials')
+
+
+def refresh_profile_stats_on_commit(profile_ids=(), timetrial_ids=()):
+    """Call refresh_profile_stats when the current transaction commits.
+
+    The profiles of the given TimeTrials are looked up at that point,
+    skipping TimeTrials without a result, which do not count towards
+    the statistics. Calls made in the same transaction are combined,
+    so each profile is only refreshed once.
+    """
+    on_commit_batch(
+        'refresh_profile_stats',
+        [('profile', pk) for pk in profile_ids] +
+        [('timetrial', pk) for pk in timetrial_ids],
+        _refresh_pending_profile_stats)
+
+
+def _refresh_pending_profile_stats(items):
+    profile_ids = {pk for kind, pk in items if kind == 'profile'}
+    timetrial_ids = {pk for kind, pk in items if kind == 'timetrial'}
+    if timetrial_ids:
+        qs = TimeTrial.raw_objects.filter(pk__in=timetrial_ids)
+        qs = qs.exclude(result='')
+        profile_ids.update(qs.values_list('profile_id', flat=True))
+    if profile_ids:
+        refresh_profile_stats(profile_ids)
+
+
+@python_2_unicode_compatible
+class ChangeLog(models.Model):
+    """A TimeTrial that was inserted, updated or deleted.
+
+    The id is the revision of the change. Entries are written by
+    log_change_on_commit after the transaction making the change commits,
+    and the revision is then stored on the TimeTrial and its changed legs.
+    Changes to legs are logged as updates of their TimeTrial.
+    Writing entries bumps the 'timetrials' version (see kasse.versions).
+    """
+
+    ACTIONS = (
+        ('insert', 'Insert'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    )
+
+    timetrial_id = models.IntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    time = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return '%s: %s %s' % (self.pk, self.action, self.timetrial_id)
+
+
+def log_change_on_commit(timetrial_id, action):
+    """Write a ChangeLog entry when the current transaction commits.
+
+    Changes to the same TimeTrial in one transaction are combined
+    into a single entry.
+    """
+    on_commit_batch('log_change', [(timetrial_id, action)],
+                    _write_pending_changes)
+
+
+def _write_pending_changes(items):
+    pending = {}
+    for timetrial_id, action in items:
+        pending.setdefault(timetrial_id, []).append(action)
+    with transaction.atomic():
+        for timetrial_id, actions in sorted(pending.items()):
+            if 'delete' in actions:
+                if 'insert' in actions:
+                    continue
+                action = 'delete'
+            elif 'insert' in actions:
+                action = 'insert'
+            else:
+                action = 'update'
+            entry = ChangeLog.objects.create(
+                timetrial_id=timetrial_id, action=action)
+            if action != 'delete':
+                updated = TimeTrial.raw_objects.filter(
+                    pk=timetrial_id).update(revision=entry.pk)
+                if not updated:
+                    # Inserted in a savepoint that was rolled back.
+                    entry.delete()
+                    continue
+                Leg.raw_objects.filter(
+                    timetrial_id=timetrial_id, revision=None).update(
+                        revision=entry.pk)
+        if pending:
+            bump_version_on_commit('timetrials')
 
 
 def move_profile(target, destination):
-    TimeTrial.objects.filter(profile=target).update(profile=destination)
-    TimeTrial.objects.filter(creator=target).update(creator=destination)
+    now = timezone.now()
+    qs = TimeTrial.objects.filter(Q(profile=target) | Q(creator=target))
+    for timetrial_id in qs.values_list('pk', flat=True):
+        log_change_on_commit(timetrial_id, 'update')
+    TimeTrial.objects.filter(profile=target).update(
+        profile=destination, updated_time=now)
+    TimeTrial.objects.filter(creator=target).update(
+        creator=destination, updated_time=now)
+    refresh_profile_stats([target.pk, destination.pk])
 
 
 @python_2_unicode_compatible
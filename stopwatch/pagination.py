@@ -0,0 +1,96 @@
+# vim: set fileencoding=utf8:
+"""Keyset pagination of TimeTrials, newest first.
+
+A page is the TimeTrials after a cursor, which is the (start_time, pk) of
+the last TimeTrial on the previous page. Unlike OFFSET, the database can
+find the start of a page with an index on start_time, so every page
+takes the same time regardless of how far back it is.
+
+TimeTrials without a start time are listed last, ordered by pk.
+"""
+from __future__ import absolute_import, unicode_literals, division
+
+import collections
+import datetime
+
+from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
+from django.utils.http import urlencode
+
+
+TIMETRIAL_PAGE_SIZE = 100
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+Page = collections.namedtuple('Page', 'object_list next_cursor')
+
+
+def encode_cursor(timetrial):
+    """Return the cursor of the page after the given TimeTrial."""
+    if timetrial.start_time is None:
+        return '_%d' % timetrial.pk
+    micros = (timetrial.start_time - EPOCH) // datetime.timedelta(
+        microseconds=1)
+    return '%d_%d' % (micros, timetrial.pk)
+
+
+def decode_cursor(cursor):
+    """Return (start_time, pk) from encode_cursor.
+
+    Raises Http404 if the cursor is not valid.
+    """
+    try:
+        micros, pk = cursor.split('_')
+        pk = int(pk)
+        if micros:
+            start_time = EPOCH + datetime.timedelta(microseconds=int(micros))
+        else:
+            start_time = None
+    except (ValueError, OverflowError):
+        raise Http404('Invalid cursor')
+    return start_time, pk
+
+
+def get_timetrial_page(qs, cursor=None, size=TIMETRIAL_PAGE_SIZE):
+    """Return the Page of TimeTrials in qs after the given cursor,
+    or the first page if cursor is None."""
+    dated = qs.filter(start_time__isnull=False).order_by('-start_time', '-pk')
+    undated = qs.filter(start_time__isnull=True).order_by('-pk')
+    if cursor is None:
+        start_time = pk = None
+    else:
+        start_time, pk = decode_cursor(cursor)
+
+    if pk is None or start_time is not None:
+        if pk is not None:
+            dated = dated.filter(
+                Q(start_time__lt=start_time) |
+                Q(start_time=start_time, pk__lt=pk))
+        object_list = list(dated[:size + 1])
+    else:
+        object_list = []
+        undated = undated.filter(pk__lt=pk)
+    if len(object_list) <= size:
+        object_list += list(undated[:size + 1 - len(object_list)])
+
+    if len(object_list) > size:
+        object_list = object_list[:size]
+        return Page(object_list, encode_cursor(object_list[-1]))
+    return Page(object_list, None)
+
+
+def get_page_context(request, qs, page_url, fragment_url):
+    """Return the context of stopwatch/timetrialtable.html for the page
+    of qs after the cursor in request.GET['after'].
+
+    next_url is the next page and more_url is the rows of the next page
+    alone, which kasse/loadmore.js appends to the table.
+    """
+    page = get_timetrial_page(qs, request.GET.get('after'))
+    context = {'timetrial_list': page.object_list}
+    if page.next_cursor is not None:
+        query = '?' + urlencode({'after': page.next_cursor})
+        context['next_url'] = page_url + query
+        context['more_url'] = fragment_url + query
+    return context
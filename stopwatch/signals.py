@@ -0,0 +1,86 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from stopwatch.models import (
+    TimeTrial, Leg, legs_changed, refresh_profile_stats_on_commit,
+    log_change_on_commit,
+)
+from stopwatch.live import refresh_live_state_on_commit
+
+
+@receiver(pre_save, sender=TimeTrial)
+def timetrial_pre_save(sender, instance, raw=False, update_fields=None,
+                       **kwargs):
+    # Remember the profile and result in the database, since the
+    # statistics of the previous profile must be refreshed too if the
+    # profile is changed, and a live TimeTrial that stays live does not
+    # change the statistics.
+    instance.previous_profile_id = instance.profile_id
+    instance.previous_result = instance.result
+    if raw or instance.pk is None:
+        return
+    if (update_fields is not None and
+            not {'profile', 'result'}.intersection(update_fields)):
+        return
+    qs = TimeTrial.raw_objects.filter(pk=instance.pk)
+    previous = qs.values_list('profile_id', 'result').first()
+    if previous is not None:
+        instance.previous_profile_id, instance.previous_result = previous
+
+
+def is_still_live(instance):
+    """Return True if a saved TimeTrial was live before and after saving,
+    i.e. the save does not change the statistics of its profile."""
+    return (instance.result == '' and instance.previous_result == '' and
+            instance.previous_profile_id == instance.profile_id)
+
+
+@receiver(post_save, sender=TimeTrial)
+def timetrial_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    log_change_on_commit(instance.pk, 'insert' if created else 'update')
+
+
+@receiver(post_delete, sender=TimeTrial)
+def timetrial_deleted(sender, instance, **kwargs):
+    log_change_on_commit(instance.pk, 'delete')
+
+
+@receiver(post_save, sender=TimeTrial)
+def timetrial_changed(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or not is_still_live(instance):
+        refresh_profile_stats_on_commit(profile_ids=[
+            instance.previous_profile_id, instance.profile_id])
+    refresh_live_state_on_commit(instance.pk)
+
+
+@receiver(post_delete, sender=TimeTrial)
+def timetrial_removed(sender, instance, **kwargs):
+    refresh_profile_stats_on_commit(profile_ids=[instance.profile_id])
+    refresh_live_state_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=Leg)
+@receiver(post_delete, sender=Leg)
+def leg_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_profile_stats_on_commit(timetrial_ids=[instance.timetrial_id])
+    refresh_live_state_on_commit(instance.timetrial_id)
+    log_change_on_commit(instance.timetrial_id, 'update')
+
+
+@receiver(legs_changed, sender=TimeTrial)
+def timetrial_legs_changed(sender, instance, **kwargs):
+    # The legs of a live TimeTrial do not count until it is finished,
+    # which saves the TimeTrial and refreshes the statistics.
+    if instance.result != '':
+        refresh_profile_stats_on_commit(profile_ids=[instance.profile_id])
+    refresh_live_state_on_commit(instance.pk)
+    log_change_on_commit(instance.pk, 'update')
@@ -359,9 +359,11 @@ function post_live_update() {
 
 function fetch_state() {
   const now = new Date().getTime();
-  function success(data: any) {
+  function success(data: any, textStatus: string) {
     roundtrip_estimate = (new Date().getTime() - now) | 0;
     console.log("roundtrip_estimate: " + roundtrip_estimate + " ms");
+    // The state is unchanged since the previous request.
+    if (textStatus === "notmodified") return;
     data["elapsed_time"] = data["elapsed_time"] + roundtrip_estimate / 2000;
     console.log(data);
     update_state(data);
@@ -373,7 +375,10 @@ function fetch_state() {
       document.createTextNode(textStatus + ", " + error + "\n")
     );
   }
-  $.getJSON(".", success).fail(fail);
+  const url = reverse("timetrial_live_state", fetch_pk as number) as string;
+  $.ajax({ url: url, dataType: "json", ifModified: true })
+    .done(success)
+    .fail(fail);
 }
 
 const update_state = action((remoteState: any) => {
@@ -3,20 +3,24 @@ from __future__ import absolute_import, unicode_literals, division
 from django.conf.urls import url
 
 from stopwatch.views import (
-    Json, ImageList,
+    Json, JsonChanges, ImageList,
     TimeTrialCreate, TimeTrialDetail, TimeTrialList, TimeTrialBest,
     TimeTrialAllBest, TimeTrialStopwatch, TimeTrialUpdate,
     TimeTrialStopwatchCreate, TimeTrialStopwatchLive, TimeTrialLiveUpdate,
-    TimeTrialTimeline,
+    TimeTrialLiveState, TimeTrialTimeline,
 )
 
 urlpatterns = [
     url(r'^$', TimeTrialList.as_view(),
         name='timetrial_list'),
+    url(r'^more/$', TimeTrialList.as_view(),
+        name='timetrial_list_more', kwargs={'fragment': True}),
     url(r'^json/$', Json.as_view(),
         name='timetrial_json'),
     url(r'^json/live/$', Json.as_view(),
         name='timetrial_json_live', kwargs={'live': True}),
+    url(r'^json/changes/$', JsonChanges.as_view(),
+        name='timetrial_json_changes'),
     url(r'^best/$', TimeTrialAllBest.as_view(),
         name='timetrial_best', kwargs={'season': 'alltime'}),
     url(r'^best/(?P<legs>\d+)/$', TimeTrialBest.as_view(),
@@ -37,6 +41,8 @@ urlpatterns = [
         name='timetrial_live'),
     url(r'^(?P<pk>\d+)/liveupdate/$', TimeTrialLiveUpdate.as_view(),
         name='timetrial_liveupdate'),
+    url(r'^(?P<pk>\d+)/live/state/$', TimeTrialLiveState.as_view(),
+        name='timetrial_live_state'),
     url(r'^stopwatch/$', TimeTrialStopwatchCreate.as_view(),
         name='timetrial_stopwatch_create'),
     url(r'^(?P<pk>\d+)/stopwatch/$', TimeTrialStopwatch.as_view(),
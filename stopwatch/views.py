@@ -3,18 +3,24 @@ from __future__ import absolute_import, unicode_literals, division
 
 import json
 import logging
+import re
 import datetime
 
+from django.db import transaction
 from django.db.utils import NotSupportedError
 from django.core.exceptions import FieldError, ValidationError
 from django.urls import reverse
 from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.safestring import mark_safe
 from django.http import (
     HttpResponse, JsonResponse, HttpResponseRedirect,
-    HttpResponseForbidden,
+    HttpResponseForbidden, HttpResponseBadRequest, Http404,
+    StreamingHttpResponse,
 )
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.views.defaults import permission_denied
 from django.views.generic import (
     TemplateView, FormView, DetailView, ListView, UpdateView, View,
@@ -27,9 +33,14 @@ from stopwatch.forms import (
     TimeTrialCreateForm, TimeTrialForm,
     StopwatchForm, TimeTrialLiveForm,
 )
-from stopwatch.models import TimeTrial, Leg, Beverage, Image
+from stopwatch.models import (
+    TimeTrial, Leg, Beverage, Image, PersonalBest, ChangeLog,
+)
+from stopwatch.live import get_live_state, get_live_state_data
+from stopwatch.pagination import get_page_context
 from kasse.views import Home
-from kasse.models import Profile, Title, Association
+from kasse.models import Profile
+from kasse.names import get_profile_names, get_profile_name
 
 logger = logging.getLogger('kasse')
 
@@ -87,11 +98,7 @@ class TimeTrialCreate(FormView):
             return HttpResponseRedirect(
                 reverse('timetrial_stopwatch',
                         kwargs={'pk': tt.pk}))
-        for i, duration in enumerate(durations):
-            leg = Leg(timetrial=tt,
-                      duration=duration.total_seconds(),
-                      order=i + 1)
-            leg.save()
+        tt.set_legs([d.total_seconds() for d in durations])
         logger.info("%s %s created by %s",
                     TimeTrial.objects.get(pk=tt.pk),
                     ' '.join(map(str, durations)),
@@ -146,6 +153,17 @@ def get_time_attack(current_timetrial, **kwargs):
                 leg_count=current_timetrial.leg_count or 5,
             )
             qs = qs.order_by('duration')
+            # The all-time PersonalBest is the answer unless it was
+            # created after current_timetrial.
+            best = PersonalBest.objects.filter(
+                profile_id=current_timetrial.profile_id, prefix=False,
+                season=None, leg_count=current_timetrial.leg_count or 5)
+            best = best.first()
+            if best is None:
+                qs = qs.none()
+            elif (best.timetrial.created_time <
+                  current_timetrial.created_time):
+                qs = [best.timetrial]
         try:
             prev = qs[0]
         except IndexError:
@@ -231,9 +249,10 @@ class TimeTrialStopwatch(UpdateView, TimeTrialStateMixin):
         self.object.start_time = form.cleaned_data['start_time']
         self.object.residue = form.cleaned_data['residue']
         self.object.comment = form.cleaned_data['comment']
-        self.object.save_robust()
-        self.object.set_legs(
-            [d.total_seconds() for d in form.cleaned_data['durations']])
+        with transaction.atomic():
+            self.object.save_robust()
+            self.object.set_legs(
+                [d.total_seconds() for d in form.cleaned_data['durations']])
         for image in form.cleaned_data['images']:
             self.object.image_set.create(image=image)
 
@@ -264,8 +283,10 @@ class TimeTrialLiveUpdate(BaseFormView):
         if timetrial.creator != self.request.profile:
             return HttpResponseForbidden(
                 'Access denied (only creator can update)')
-        old_legs = [l.duration for l in timetrial.leg_set.all()]
+        old_legs = timetrial.get_durations()
         legs = [d.total_seconds() for d in form.cleaned_data['durations']]
+        fields = ('result', 'possible_laps', 'state', 'start_time')
+        old_values = [getattr(timetrial, f) for f in fields]
         timetrial.result = ''
         timetrial.possible_laps = form.cleaned_data['possible_laps']
         timetrial.state = form.cleaned_data['state']
@@ -276,15 +297,20 @@ class TimeTrialLiveUpdate(BaseFormView):
         if not (old_legs and legs[:len(old_legs)] == old_legs):
             timetrial.start_time = timezone.now() - latency - elapsed_time
 
-        timetrial.save_robust()
-
-        if not legs and old_legs:
-            logger.info("%s %s reset by %s",
-                        timetrial,
-                        ' '.join(map(str, old_legs)),
-                        self.request.profile,
-                        extra=self.request.log_data)
-        timetrial.set_legs(legs)
+        # Only write the fields and legs that have changed.
+        changed = [f for f, v in zip(fields, old_values)
+                   if getattr(timetrial, f) != v]
+        with transaction.atomic():
+            if changed:
+                timetrial.save_robust(update_fields=changed)
+
+            if not legs and old_legs:
+                logger.info("%s %s reset by %s",
+                            timetrial,
+                            ' '.join(map(str, old_legs)),
+                            self.request.profile,
+                            extra=self.request.log_data)
+            timetrial.set_legs(legs)
         return HttpResponse('OK')
 
 
@@ -330,6 +356,27 @@ class TimeTrialStopwatchLive(DetailView, TimeTrialStateMixin):
                 context, **kwargs)
 
 
+class TimeTrialLiveState(View):
+    '''Lightweight state of a TimeTrial for the live stopwatch to poll.
+
+    Served from the cached snapshot in stopwatch.live with an ETag,
+    so unchanged states are answered with 304 Not Modified.
+    time_attack is only included in the initial state of the live page.
+    '''
+
+    def get(self, request, pk):
+        snapshot = get_live_state(int(pk))
+        if snapshot is None:
+            raise Http404()
+        etag = quote_etag(snapshot['version'])
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse(get_live_state_data(snapshot))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
 class TimeTrialDetail(DetailView):
     model = TimeTrial
     template_name = 'stopwatch/timetrialdetail.html'
@@ -351,7 +398,8 @@ class TimeTrialDetail(DetailView):
             leg.diff = None
         if prev:
             for leg, prev_leg in zip(laps, prev.leg_set.all()):
-                leg.diff = leg.duration_prefix_sum - prev_leg.duration_prefix_sum
+                leg.diff = (
+                    leg.cumulative_duration - prev_leg.cumulative_duration)
             context_data['prev'] = prev
             context_data['prev_person'] = time_attack['person']
         context_data['laps'] = laps
@@ -376,16 +424,32 @@ class TimeTrialTimeline(DetailView):
         return context_data
 
 
-class TimeTrialList(ListView):
+class TimeTrialList(TemplateView):
+    '''The latest TimeTrials, one page at a time.
+
+    With the fragment kwarg only the rows of the page are rendered,
+    for the "Vis flere" link.
+    '''
+
     template_name = 'stopwatch/timetriallist.html'
+    fragment_template_name = 'stopwatch/timetrialpage.html'
+
+    def get_template_names(self):
+        if self.kwargs.get('fragment'):
+            return [self.fragment_template_name]
+        return [self.template_name]
 
     def get_queryset(self):
-        queryset = (
-            TimeTrial.objects.exclude(result='')
-            .order_by('-start_time')
-        )
+        queryset = TimeTrial.objects.exclude(result='')
         return self.request.filter_association(queryset)
 
+    def get_context_data(self, **kwargs):
+        context_data = super(TimeTrialList, self).get_context_data(**kwargs)
+        context_data.update(get_page_context(
+            self.request, self.get_queryset(),
+            reverse('timetrial_list'), reverse('timetrial_list_more')))
+        return context_data
+
 
 class TimeTrialUpdate(UpdateView):
     form_class = TimeTrialForm
@@ -415,22 +479,22 @@ class TimeTrialAllBest(TemplateView):
         if self.kwargs['season'] == 'current':
             season_start = Home.get_season_start()
             context_data['timetrial_list'] = self.get_timetrial_list(
-                start_time__gt=season_start)
+                season=season_start.year)
         else:
             context_data['timetrial_list'] = self.get_timetrial_list()
         return context_data
 
-    def get_timetrial_list(self, **kwargs):
-        qs = TimeTrial.objects.filter(result='f', **kwargs)
+    def get_timetrial_list(self, season=None):
+        qs = PersonalBest.objects.filter(prefix=False, season=season)
         qs = self.request.filter_association(qs)
         qs = qs.order_by('leg_count', 'duration')
         try:
             qs_distinct = qs.distinct('leg_count')
-            return list(qs_distinct)
+            return [pb.timetrial for pb in qs_distinct]
         except (NotImplementedError, FieldError, NotSupportedError):
             res = {}
-            for tt in qs:
-                res.setdefault(tt.leg_count, tt)
+            for pb in qs:
+                res.setdefault(pb.leg_count, pb.timetrial)
             return sorted(res.values(), key=lambda tt: tt.leg_count)
 
 
@@ -442,97 +506,214 @@ class TimeTrialBest(TemplateView):
         if self.kwargs['season'] == 'current':
             season_start = Home.get_season_start()
             context_data['timetrial_list'] = self.get_timetrial_list(
-                start_time__gt=season_start)
+                season=season_start.year)
         else:
             context_data['timetrial_list'] = self.get_timetrial_list()
         context_data['list_legs'] = self.kwargs['legs']
         return context_data
 
-    def get_timetrial_list(self, **kwargs):
-        qs = (
-            TimeTrial.leg_prefix(int(self.kwargs['legs']))
-            .filter(result='f', **kwargs)
-            .order_by('duration')
-        )
+    def get_timetrial_list(self, season=None):
+        qs = PersonalBest.objects.filter(
+            prefix=True, leg_count=int(self.kwargs['legs']), season=season)
         qs = self.request.filter_association(qs)
-        try:
-            qs_distinct = qs.distinct('profile')
-            return list(qs_distinct)
-        except (NotImplementedError, NotSupportedError):
-            res = {}
-            for tt in qs:
-                res.setdefault(tt.profile_id, tt)
-            return sorted(res.values(), key=lambda tt: tt.duration)
+        qs = qs.order_by('duration')
+        res = []
+        for pb in qs:
+            # Show the duration of the prefix rather than the whole TimeTrial
+            tt = pb.timetrial
+            tt.leg_count = pb.leg_count
+            tt.duration = pb.duration
+            res.append(tt)
+        return res
 
 
-class IndentJSONEncoder(DjangoJSONEncoder):
-    def __init__(self, *args, **kwargs):
-        kwargs['indent'] = 2
-        return super(IndentJSONEncoder, self).__init__(*args, **kwargs)
+class Json(View):
+    '''TimeTrials with their legs as JSON, ordered by id.
 
+    The response is streamed, reading chunk_size TimeTrials at a time.
+    Query parameters:
+
+    since_id -- only TimeTrials with a larger id
+    updated_since -- only TimeTrials changed at or after this time
+                     (ISO 8601, e.g. the updated_time of a TimeTrial)
+    limit -- at most this many TimeTrials; fetch the next page by
+             passing the last id as since_id
+    format=ndjson -- one JSON object per line instead of a JSON array
+    '''
+
+    chunk_size = 500
 
-class Json(View):
     def get(self, request, *args, **kwargs):
-        data = []
+        try:
+            qs = self.get_queryset()
+            limit = request.GET.get('limit')
+            limit = int(limit) if limit else None
+        except ValueError as exn:
+            return HttpResponseBadRequest(str(exn))
+        rows = self.iter_rows(qs, limit)
+        if request.GET.get('format') == 'ndjson':
+            content = ('%s\n' % self.dumps(row) for row in rows)
+            content_type = 'application/x-ndjson'
+        else:
+            content = self.iter_json_array(rows)
+            content_type = 'application/json'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+
+    def get_queryset(self):
         qs = TimeTrial.raw_objects.all()
-        leg_qs = Leg.raw_objects.all()
-        profile_qs = Profile.objects.all()
         if self.kwargs.get('live'):
             now = timezone.now()
             threshold = now - datetime.timedelta(hours=1)
             qs = qs.filter(result='', start_time__gt=threshold)
-            leg_qs = leg_qs.filter(timetrial__in=qs)
-
-        profile_qs = profile_qs.order_by()
-        profile_qs = profile_qs.values_list(
-            'id', 'title__period', 'title__title', 'name', 'association_id', 'association__current_period', 'association__name')
-        names = {}
-        associations = {}
-        for profile_id, title_period, title, name, a_id, a_period, a_name in profile_qs:
-            dummy = Profile()
-            dummy.pk = profile_id
-            dummy_a = Association()
-            dummy_a.pk = a_id
-            dummy_a.name = a_name
-            dummy_a.current_period = a_period
-            dummy_t = Title(association=dummy_a, period=title_period, title=title)
-            dummy.title = dummy_t if title else None
-            dummy.name = name
-            names[profile_id] = str(dummy)
-            associations[profile_id] = a_id
-
-        leg_qs = leg_qs.order_by()
-        leg_qs = leg_qs.values_list('timetrial_id', 'duration', 'order')
-        legs = {}
-        for tt_id, duration, order in leg_qs:
-            legs.setdefault(tt_id, []).append((order, duration))
-
-        qs = qs.values_list(
-            'id', 'start_time', 'profile_id',
-            'result', 'comment', 'residue',
-        )
+        since_id = self.request.GET.get('since_id')
+        if since_id:
+            qs = qs.filter(id__gt=int(since_id))
+        updated_since = self.request.GET.get('updated_since')
+        if updated_since:
+            # An unescaped + in the UTC offset is decoded as a space.
+            updated_since = re.sub(r' (\d\d:?\d\d)$', r'+\1',
+                                   updated_since)
+            t = parse_datetime(updated_since)
+            if t is None:
+                raise ValueError('updated_since must be an ISO 8601 time')
+            if timezone.is_naive(t):
+                t = timezone.make_aware(t)
+            qs = qs.filter(updated_time__gte=t)
+        return qs.order_by('id')
+
+    def dumps(self, row):
+        return json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+    def iter_json_array(self, rows):
+        sep = '['
+        for row in rows:
+            yield sep + self.dumps(row)
+            sep = ','
+        yield '[]' if sep == '[' else ']'
+
+    def iter_rows(self, qs, limit=None):
+        fields = ('id', 'start_time', 'profile_id', 'result', 'comment',
+                  'residue', 'updated_time')
+        names = get_profile_names()
+        last_id = None
+        while limit is None or limit > 0:
+            chunk_qs = qs if last_id is None else qs.filter(id__gt=last_id)
+            size = self.chunk_size if limit is None else min(
+                limit, self.chunk_size)
+            chunk = list(chunk_qs.values_list(*fields)[:size])
+            if not chunk:
+                return
+            last_id = chunk[-1][0]
+            if limit is not None:
+                limit -= len(chunk)
+
+            leg_qs = Leg.raw_objects.filter(
+                timetrial_id__in=[row[0] for row in chunk])
+            leg_qs = leg_qs.order_by('timetrial_id', 'order')
+            legs = {}
+            for tt_id, duration in leg_qs.values_list(
+                    'timetrial_id', 'duration'):
+                legs.setdefault(tt_id, []).append(duration)
+
+            for (tt_id, start_time, profile_id, result, comment, residue,
+                 updated_time) in chunk:
+                profile_name = names.get(profile_id)
+                if profile_name is None:
+                    profile_name = get_profile_name(
+                        Profile.objects.get(pk=profile_id))
+                yield {
+                    'id': tt_id,
+                    'start_time': str(start_time),
+                    'profile_id': profile_id,
+                    'profile': profile_name.name,
+                    'association': profile_name.association_id,
+                    'result': result,
+                    'comment': comment,
+                    'residue': residue,
+                    'durations': legs.get(tt_id, []),
+                    'updated_time': updated_time,
+                }
+            if len(chunk) < size:
+                return
+
+
+class JsonChanges(Json):
+    '''TimeTrials changed since a revision, for keeping a copy of Json.
+
+    Query parameter: since -- the revision returned by the previous
+    request, or 0 to get every TimeTrial.
+
+    Returns the TimeTrials inserted and updated since that revision
+    (in the format of Json), the ids of the deleted TimeTrials and the
+    revision to pass next time. If more is true, there are more changes
+    than page_size ChangeLog entries, so request again right away.
+
+    ChangeLog entries are written by concurrent transactions, so an entry
+    may become visible after entries with a higher revision. The returned
+    revision is therefore before the entries of the last settle_time,
+    which are returned again by the next request. Clients must apply the
+    changes idempotently: an insert of a TimeTrial they already have is
+    an update, and a delete of one they do not have is ignored.
+    '''
+
+    page_size = 500
+    settle_time = datetime.timedelta(seconds=60)
 
-        for tt_id, start_time, profile_id, result, comment, residue in qs:
-            durations = [d for o, d in sorted(legs.get(tt_id, ()))]
-            tt_data = {
-                'id': tt_id,
-                'start_time': str(start_time),
-                'profile_id': profile_id,
-                'profile': names.get(profile_id),
-                'association': associations.get(profile_id),
-                'result': result,
-                'comment': comment,
-                'residue': residue,
-                'durations': durations,
-            }
-            data.append(tt_data)
-        response = JsonResponse(data, safe=False, encoder=IndentJSONEncoder)
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.GET.get('since') or 0)
+        except ValueError as exn:
+            return HttpResponseBadRequest(str(exn))
+        settled = timezone.now() - self.settle_time
+        entries = ChangeLog.objects.filter(pk__gt=since).order_by('pk')
+        entries = list(entries.values_list(
+            'pk', 'timetrial_id', 'action', 'time')[:self.page_size + 1])
+        more = len(entries) > self.page_size
+        del entries[self.page_size:]
+
+        revision = since
+        for entry_revision, timetrial_id, action, time in entries:
+            if time >= settled:
+                more = False
+                break
+            revision = entry_revision
+
+        actions = {}
+        for entry_revision, timetrial_id, action, time in entries:
+            actions.setdefault(timetrial_id, []).append(action)
+        inserted = set()
+        deleted = []
+        for timetrial_id, a in actions.items():
+            # A TimeTrial inserted and deleted is still reported as
+            # deleted, since the client may have it from the tail of
+            # the previous request.
+            if a[-1] == 'delete':
+                deleted.append(timetrial_id)
+            elif a[0] == 'insert':
+                inserted.add(timetrial_id)
+        qs = TimeTrial.raw_objects.filter(pk__in=[
+            timetrial_id for timetrial_id, a in actions.items()
+            if a[-1] != 'delete'])
+        rows = list(self.iter_rows(qs.order_by('id')))
+
+        data = {
+            'revision': revision,
+            'more': more,
+            'inserts': [row for row in rows if row['id'] in inserted],
+            'updates': [row for row in rows if row['id'] not in inserted],
+            'deletes': sorted(deleted),
+        }
+        response = JsonResponse(
+            data, encoder=DjangoJSONEncoder,
+            json_dumps_params={'separators': (',', ':')})
         response['Access-Control-Allow-Origin'] = '*'
         return response
 
 
 class ImageList(ListView):
-    model = Image
+    queryset = Image.objects.select_related('timetrial')
     template_name = 'stopwatch/image_list.html'
-    # paginate_by = 30
-    ordering = ['-created_time']
+    paginate_by = 30
+    ordering = ['-created_time', '-pk']
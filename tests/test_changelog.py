@@ -0,0 +1,149 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import datetime
+import json
+
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from kasse.models import Profile
+from stopwatch.models import TimeTrial, Leg, ChangeLog, move_profile
+
+
+class ChangeLogTest(TransactionTestCase):
+    # The entries are written when the transaction commits,
+    # so each test commits its changes.
+
+    def setUp(self):
+        self.profile = Profile.objects.create(name='Test')
+
+    def create(self, durations):
+        now = timezone.now()
+        with transaction.atomic():
+            timetrial = TimeTrial.objects.create(
+                profile=self.profile, creator=self.profile, result='f',
+                state='stopped', start_time=now, created_time=now)
+            timetrial.set_legs(durations)
+        return timetrial
+
+    def get_entries(self, since=0):
+        qs = ChangeLog.objects.filter(pk__gt=since).order_by('pk')
+        return list(qs.values_list('timetrial_id', 'action'))
+
+    def settle(self):
+        """Make the entries older than the settle time of JsonChanges."""
+        ChangeLog.objects.update(
+            time=timezone.now() - datetime.timedelta(minutes=2))
+
+    def get_changes(self, since):
+        response = self.client.get('/timetrial/json/changes/',
+                                   {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf8'))
+
+    def test_coalesce(self):
+        with transaction.atomic():
+            a = self.create([10, 11])
+            a.comment = 'Changed'
+            a.save()
+            a.set_legs([10, 11, 12])
+        entries = ChangeLog.objects.all()
+        self.assertEqual([(e.timetrial_id, e.action) for e in entries],
+                         [(a.pk, 'insert')])
+        revision = entries[0].pk
+        self.assertEqual(TimeTrial.objects.get(pk=a.pk).revision, revision)
+        self.assertEqual(
+            set(Leg.objects.filter(timetrial=a).values_list(
+                'revision', flat=True)),
+            {revision})
+
+        with transaction.atomic():
+            b = self.create([10])
+            b.delete()
+        self.assertEqual(self.get_entries(revision), [])
+
+        a_pk = a.pk
+        with transaction.atomic():
+            a.set_legs([10, 13, 12])
+            a.delete()
+        self.assertEqual(self.get_entries(revision), [(a_pk, 'delete')])
+
+    def test_rollback(self):
+        with transaction.atomic():
+            self.create([10])
+            transaction.set_rollback(True)
+        self.assertEqual(self.get_entries(), [])
+        a = self.create([10])
+        self.assertEqual(self.get_entries(), [(a.pk, 'insert')])
+
+    def test_changes(self):
+        a = self.create([10])
+        b = self.create([11])
+        self.settle()
+        data = self.get_changes(0)
+        self.assertEqual([row['id'] for row in data['inserts']],
+                         [a.pk, b.pk])
+        self.assertEqual(data['updates'], [])
+        self.assertEqual(data['deletes'], [])
+        self.assertFalse(data['more'])
+        revision = data['revision']
+        self.assertEqual(revision, ChangeLog.objects.latest('pk').pk)
+        self.assertEqual(self.get_changes(revision)['revision'], revision)
+
+        a.set_legs([10, 12])
+        b_pk = b.pk
+        b.delete()
+        c = self.create([13])
+        d = self.create([14])
+        d_pk = d.pk
+        d.delete()
+        self.settle()
+        data = self.get_changes(revision)
+        self.assertEqual([row['id'] for row in data['inserts']], [c.pk])
+        self.assertEqual([(row['id'], row['durations'])
+                          for row in data['updates']],
+                         [(a.pk, [10, 12])])
+        self.assertEqual(data['deletes'], [b_pk, d_pk])
+
+    def test_unsettled(self):
+        a = self.create([10])
+        b = self.create([11])
+        # Until the entry of a is visible, e.g. since its transaction
+        # has not committed yet.
+        entry = ChangeLog.objects.get(timetrial_id=a.pk)
+        ChangeLog.objects.filter(pk=entry.pk).delete()
+        data = self.get_changes(0)
+        self.assertEqual([row['id'] for row in data['inserts']], [b.pk])
+        # The revision is not advanced past the recent entries,
+        # so the next request returns them again along with a.
+        self.assertEqual(data['revision'], 0)
+        entry.save(force_insert=True)
+        data = self.get_changes(data['revision'])
+        self.assertEqual([row['id'] for row in data['inserts']],
+                         [a.pk, b.pk])
+        self.assertEqual(data['revision'], 0)
+        self.settle()
+        data = self.get_changes(data['revision'])
+        self.assertEqual(data['revision'], ChangeLog.objects.latest('pk').pk)
+
+    def test_move_profile(self):
+        a = self.create([10])
+        other = Profile.objects.create(name='Other')
+        now = timezone.now()
+        b = TimeTrial.objects.create(
+            profile=other, creator=self.profile, result='f',
+            start_time=now, created_time=now)
+        TimeTrial.objects.create(
+            profile=other, creator=other, result='f',
+            start_time=now, created_time=now)
+        revision = ChangeLog.objects.latest('pk').pk
+        destination = Profile.objects.create(name='Destination')
+        with transaction.atomic():
+            move_profile(self.profile, destination)
+        self.assertEqual(sorted(self.get_entries(revision)),
+                         [(a.pk, 'update'), (b.pk, 'update')])
+        b = TimeTrial.objects.get(pk=b.pk)
+        self.assertEqual(b.creator_id, destination.pk)
+        self.assertGreater(b.revision, revision)
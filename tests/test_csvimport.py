@@ -0,0 +1,175 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from kasse.models import Profile
+from kasse.versions import bump_version
+from iou.models import Expence, ProfileBalance
+from iou.csvimport import ExpenceRow, parse_expences
+
+
+LOOKUP = {'alice': [1], 'bob': [2], 'carl jensen': [3], 'dup': [4, 5]}
+
+
+class ParseExpencesTest(SimpleTestCase):
+    def parse(self, text):
+        return parse_expences(text.splitlines(), LOOKUP)
+
+    def assertErrors(self, text, errors):
+        """Check the messages of parse(text). A message that ends with
+        a colon only checks the line number, e.g. for the messages
+        of the amount field, which are translated by Django."""
+        with self.assertRaises(ValidationError) as cm:
+            self.parse(text)
+        messages = cm.exception.messages
+        self.assertEqual(len(messages), len(errors), messages)
+        for message, error in zip(messages, errors):
+            if error.endswith(':'):
+                self.assertTrue(message.startswith(error), message)
+            else:
+                self.assertEqual(message, error)
+
+    def test_valid(self):
+        rows = self.parse(
+            'Payer,Amount,Consumers,Comment\n'
+            'Alice,123.50,alice;BOB,Julefrokost\n'
+            '\n'
+            '  bob ,"1,05",  Carl   Jensen \n'
+            'Alice,10,Bob\n'
+            'Alice,10,Bob\n')
+        self.assertEqual(rows, [
+            ExpenceRow(1, Decimal('123.50'), [1, 2], 'Julefrokost'),
+            ExpenceRow(2, Decimal('1.05'), [3], ''),
+            # Equal rows are separate Expences.
+            ExpenceRow(1, Decimal('10'), [2], ''),
+            ExpenceRow(1, Decimal('10'), [2], ''),
+        ])
+
+    def test_header_only_first(self):
+        self.assertErrors(
+            'Alice,1,Bob\n'
+            'payer,amount,consumers,comment\n',
+            ['Linje 2: Ukendt person "payer"'])
+
+    def test_errors(self):
+        self.assertErrors(
+            'Alice,1\n'
+            'Eve,1,Bob\n'
+            'Alice,1,Dup\n'
+            'Alice,abc,Bob\n'
+            'Alice,1.234,Bob\n'
+            'Alice,1, ; \n'
+            'Alice,1,Bob;bob\n'
+            'Alice,1,Bob,comment,extra\n'
+            'Alice,1,Bob\n',
+            ['Linje 1: Forventede 3 eller 4 kolonner men fik 2',
+             'Linje 2: Ukendt person "Eve"',
+             'Linje 3: Flere personer hedder "Dup"',
+             'Linje 4:',
+             'Linje 5:',
+             'Linje 6: Ingen forbrugere',
+             'Linje 7: Samme forbruger flere gange',
+             'Linje 8: Forventede 3 eller 4 kolonner men fik 5'])
+
+
+class ImportExpencesTest(TestCase):
+    def setUp(self):
+        self.alice, self.bob, self.carl = [
+            Profile.objects.create(name=name)
+            for name in ('Alice', 'Bob', 'Carl')]
+        # Recompute the names used to look up the profiles.
+        bump_version('profile_names')
+
+    def import_file(self, text, *args):
+        fd, filename = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, filename)
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            fp.write(text)
+        stdout = StringIO()
+        call_command('import_expences', filename, *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def get_balances(self):
+        balances = dict(
+            ProfileBalance.objects.values_list('profile_id', 'balance'))
+        return [balances.get(p.pk, 0)
+                for p in (self.alice, self.bob, self.carl)]
+
+    def test_import(self):
+        output = self.import_file(
+            'Alice,100,Alice;Bob;Carl,Julefrokost\n'
+            'Bob,"10,50",Carl\n')
+        self.assertEqual(output, 'Imported 2 expences\n')
+        expences = Expence.objects.order_by('pk')
+        self.assertEqual(
+            [(e.payer_id, e.amount, e.comment,
+              sorted(e.consumers.values_list('pk', flat=True)))
+             for e in expences],
+            [(self.alice.pk, Decimal('100.00'), 'Julefrokost',
+              [self.alice.pk, self.bob.pk, self.carl.pk]),
+             (self.bob.pk, Decimal('10.50'), '', [self.carl.pk])])
+        self.assertEqual(
+            self.get_balances(),
+            [Decimal('66.66'), Decimal('-22.83'), Decimal('-43.83')])
+        call_command('refresh_ledger', verify=True, stdout=StringIO())
+
+    def test_dry_run(self):
+        output = self.import_file('Alice,100,Bob\n', '--dry-run')
+        self.assertEqual(output, '1 expences can be imported\n')
+        self.assertFalse(Expence.objects.exists())
+
+    def test_invalid_row(self):
+        # Nothing is imported if any row is invalid.
+        with self.assertRaisesMessage(CommandError, 'Ukendt person "Eve"'):
+            self.import_file('Alice,100,Bob\nEve,1,Bob\n')
+        self.assertFalse(Expence.objects.exists())
+        self.assertEqual(self.get_balances(), [0, 0, 0])
+
+
+# Link the assets instead of building them.
+@override_settings(ASSETS_DEBUG=True)
+class ExpenceImportViewTest(TestCase):
+    def setUp(self):
+        self.alice = Profile.objects.create(name='Alice')
+        self.bob = Profile.objects.create(name='Bob')
+        bump_version('profile_names')
+        self.user = User.objects.create_superuser('admin', '', 'pw')
+
+    def post(self, text):
+        f = SimpleUploadedFile('expences.csv', text.encode('utf-8'))
+        return self.client.post('/iou/import/', {'file': f})
+
+    def test_superuser_required(self):
+        user = User.objects.create_user('user', '', 'pw')
+        self.client.force_login(user)
+        self.assertEqual(self.post('Alice,1,Bob\n').status_code, 403)
+        self.assertFalse(Expence.objects.exists())
+
+    def test_import(self):
+        self.client.force_login(self.user)
+        # With the byte order mark that spreadsheets write.
+        response = self.post('\ufeffAlice,12,Alice;Bob\n')
+        self.assertRedirects(response, '/iou/', fetch_redirect_response=False)
+        self.assertEqual(
+            dict(ProfileBalance.objects.values_list('profile_id', 'balance')),
+            {self.alice.pk: 6, self.bob.pk: -6})
+
+    def test_invalid(self):
+        self.client.force_login(self.user)
+        response = self.post('Alice,12,Bob\nAlice,x,Bob\n')
+        self.assertEqual(response.status_code, 200)
+        errors = response.context['form'].errors['file']
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith('Linje 2:'), errors)
+        self.assertFalse(Expence.objects.exists())
@@ -0,0 +1,52 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import datetime
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from kasse.models import Profile
+from iou.models import Expence
+
+
+# Link the assets instead of building them.
+@override_settings(ASSETS_DEBUG=True)
+class ExpenceListTest(TestCase):
+    def setUp(self):
+        profiles = [Profile.objects.create(name='Test %d' % i)
+                    for i in range(3)]
+        start = timezone.make_aware(datetime.datetime(2019, 1, 1, 12))
+        # 60 Expences, one a day.
+        self.expences = []
+        for i in range(60):
+            expence = Expence.objects.create(
+                payer=profiles[i % 3], amount=Decimal(10 + i),
+                created_time=start + datetime.timedelta(days=i))
+            expence.consumers.set(profiles[:1 + i % 3])
+            self.expences.append(expence)
+
+    def get(self, **query):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/iou/', query)
+        self.assertEqual(response.status_code, 200)
+        pks = [e.pk for e in response.context['object_list']]
+        return pks, len(ctx)
+
+    def test_pages(self):
+        newest_first = [e.pk for e in reversed(self.expences)]
+        first, queries = self.get()
+        self.assertEqual(first, newest_first[:50])
+        second, second_queries = self.get(page=2)
+        self.assertEqual(second, newest_first[50:])
+        # The consumers are prefetched, so the number of queries
+        # does not depend on the number of Expences on the page.
+        self.assertEqual(queries, second_queries)
+
+    def test_dates(self):
+        pks, queries = self.get(start_date='2019-01-03',
+                                end_date='2019-01-05')
+        self.assertEqual(pks, [e.pk for e in self.expences[4:1:-1]])
@@ -0,0 +1,129 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import datetime
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from kasse.models import Profile
+from kasse.versions import bump_version
+from stopwatch.models import TimeTrial
+from stopwatch.views import Json
+
+
+class JsonTest(TestCase):
+    def setUp(self):
+        bump_version('profile_names')
+        self.profiles = [Profile.objects.create(name='Test %d' % i)
+                         for i in range(2)]
+        self.start_time = timezone.now() - datetime.timedelta(days=1)
+        self.timetrials = []
+        for i in range(7):
+            profile = self.profiles[i % 2]
+            timetrial = TimeTrial.objects.create(
+                profile=profile, creator=profile, result='f',
+                state='stopped', start_time=self.start_time,
+                created_time=self.start_time)
+            timetrial.set_legs([10 + j for j in range(i % 4)])
+            self.timetrials.append(timetrial)
+        # Make the updated times distinct and in the order of the ids.
+        for i, timetrial in enumerate(self.timetrials):
+            timetrial.updated_time = self.start_time + datetime.timedelta(
+                seconds=i, microseconds=i)
+            TimeTrial.objects.filter(pk=timetrial.pk).update(
+                updated_time=timetrial.updated_time)
+        # Read more than one chunk.
+        self.chunk_size = Json.chunk_size
+        Json.chunk_size = 3
+
+    def tearDown(self):
+        Json.chunk_size = self.chunk_size
+
+    def get(self, **params):
+        response = self.client.get(reverse('timetrial_json'), params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf8')
+        if params.get('format') == 'ndjson':
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            return [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(content)
+
+    def get_ids(self, **params):
+        return [row['id'] for row in self.get(**params)]
+
+    def expected(self, timetrial):
+        """The row of the JSON export from before it was streamed,
+        with updated_time added."""
+        return {
+            'id': timetrial.pk,
+            'start_time': str(timetrial.start_time),
+            'profile_id': timetrial.profile_id,
+            'profile': str(timetrial.profile),
+            'association': timetrial.profile.association_id,
+            'result': timetrial.result,
+            'comment': timetrial.comment,
+            'residue': timetrial.residue,
+            'durations': [leg.duration for leg in
+                          timetrial.leg_set.order_by('order')],
+        }
+
+    def test_export(self):
+        data = self.get()
+        expected = [self.expected(tt) for tt in self.timetrials]
+        self.assertEqual(
+            [{k: v for k, v in row.items() if k != 'updated_time'}
+             for row in data],
+            expected)
+        self.assertEqual(self.get(format='ndjson'), data)
+
+    def test_empty(self):
+        self.assertEqual(self.get(since_id=self.timetrials[-1].pk), [])
+        self.assertEqual(
+            self.get(since_id=self.timetrials[-1].pk, format='ndjson'), [])
+
+    def test_pages(self):
+        ids = [tt.pk for tt in self.timetrials]
+        for limit in (1, 2, 3, 4, 10):
+            pages = []
+            page = self.get_ids(limit=limit)
+            while page:
+                self.assertLessEqual(len(page), limit)
+                pages.append(page)
+                page = self.get_ids(limit=limit, since_id=page[-1])
+            self.assertEqual(sum(pages, []), ids)
+            self.assertEqual(len(pages), -(-len(ids) // limit))
+
+    def test_updated_since(self):
+        ids = [tt.pk for tt in self.timetrials]
+        t = self.timetrials[3].updated_time
+        # The boundary is included.
+        self.assertEqual(self.get_ids(updated_since=t.isoformat()), ids[3:])
+        # The updated_time of a row, as given by the export, can be passed
+        # back to get the rows changed since then.
+        row = self.get()[3]
+        self.assertEqual(self.get_ids(updated_since=row['updated_time']),
+                         ids[3:])
+        # An unescaped + in the UTC offset is decoded as a space.
+        self.assertEqual(t.isoformat()[-6:], '+00:00')
+        response = self.client.get(
+            reverse('timetrial_json') +
+            '?updated_since=' + t.isoformat())
+        content = b''.join(response.streaming_content).decode('utf8')
+        self.assertEqual([row['id'] for row in json.loads(content)],
+                         ids[3:])
+        # Combined with since_id and limit.
+        self.assertEqual(
+            self.get_ids(updated_since=t.isoformat(), since_id=ids[4],
+                         limit=1),
+            ids[5:6])
+
+    def test_bad_request(self):
+        url = reverse('timetrial_json')
+        for params in ({'limit': 'x'}, {'since_id': 'x'},
+                       {'updated_since': 'yesterday'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400)
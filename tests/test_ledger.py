@@ -0,0 +1,102 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, TransactionTestCase
+
+from kasse.models import Profile
+from iou.models import (
+    Expence, LedgerEntry, ProfileBalance, split_amount, move_profile,
+)
+
+
+class SplitAmountTest(SimpleTestCase):
+    def test_split_amount(self):
+        amounts = ['0.00', '0.01', '0.05', '-0.05', '33.33', '100.00',
+                   '-99.99', '1234.57']
+        for amount in map(Decimal, amounts):
+            for n in range(1, 8):
+                with self.subTest(amount=amount, n=n):
+                    shares = split_amount(amount, n)
+                    self.assertEqual(len(shares), n)
+                    self.assertEqual(sum(shares), amount)
+                    self.assertLessEqual(
+                        max(shares) - min(shares), Decimal('0.01'))
+                    for share in shares:
+                        self.assertEqual(share, share.quantize(
+                            Decimal('0.01')))
+
+
+class LedgerTest(TransactionTestCase):
+    # The ledger is posted when the transaction commits,
+    # so each step commits its changes.
+
+    def setUp(self):
+        self.a, self.b, self.c = [
+            Profile.objects.create(name=name) for name in 'ABC']
+
+    def assertBalances(self, a, b, c):
+        balances = dict(
+            ProfileBalance.objects.values_list('profile_id', 'balance'))
+        self.assertEqual(
+            [balances.get(p.pk, 0) for p in (self.a, self.b, self.c)],
+            [Decimal(a), Decimal(b), Decimal(c)])
+        qs = LedgerEntry.objects.order_by().values_list('expence_id')
+        for expence_id, total in qs.annotate(s=Sum('amount')):
+            self.assertEqual(total, 0)
+        call_command('refresh_ledger', verify=True, stdout=StringIO())
+
+    def test_create_edit_delete(self):
+        with transaction.atomic():
+            expence = Expence.objects.create(
+                payer=self.a, amount=Decimal('100.00'))
+            expence.consumers.set([self.a, self.b, self.c])
+        self.assertBalances('66.66', '-33.33', '-33.33')
+
+        with transaction.atomic():
+            expence.amount = Decimal('90.00')
+            expence.save()
+            expence.consumers.remove(self.c)
+        self.assertBalances('45.00', '-45.00', '0.00')
+
+        expence.payer = self.c
+        expence.save()
+        self.assertBalances('-45.00', '-45.00', '90.00')
+
+        expence.delete()
+        self.assertBalances('0.00', '0.00', '0.00')
+        # The ledger is append-only: 3 entries for creating the Expence,
+        # 3 for the first change, 2 for the new payer and 3 for deleting.
+        self.assertEqual(LedgerEntry.objects.count(), 11)
+
+    def test_rollback(self):
+        with transaction.atomic():
+            expence = Expence.objects.create(
+                payer=self.a, amount=Decimal('10.00'))
+            expence.consumers.set([self.b])
+            transaction.set_rollback(True)
+        with transaction.atomic():
+            expence = Expence.objects.create(
+                payer=self.b, amount=Decimal('20.00'))
+            expence.consumers.set([self.c])
+        self.assertBalances('0.00', '20.00', '-20.00')
+
+    def test_move_profile(self):
+        with transaction.atomic():
+            expence = Expence.objects.create(
+                payer=self.a, amount=Decimal('30.00'))
+            expence.consumers.set([self.a, self.b])
+        entries = list(LedgerEntry.objects.values_list(
+            'pk', 'profile_id', 'amount'))
+        move_profile(self.a, self.c)
+        self.assertBalances('0.00', '-15.00', '15.00')
+        # The entries of a are kept and compensated.
+        self.assertEqual(
+            list(LedgerEntry.objects.values_list(
+                'pk', 'profile_id', 'amount')[:len(entries)]),
+            entries)
@@ -0,0 +1,152 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from kasse.models import Profile
+from stopwatch.models import TimeTrial
+
+
+class LiveUpdateTest(TransactionTestCase):
+    # The snapshot of the live state is rebuilt when the update commits,
+    # so each test commits its changes.
+
+    def setUp(self):
+        cache.clear()
+        self.profile = Profile.objects.create(name='Test')
+        now = timezone.now()
+        self.timetrial = TimeTrial.objects.create(
+            profile=self.profile, creator=self.profile, result='',
+            state='initial', start_time=None, created_time=now)
+        session = self.client.session
+        session['kasse_profile_id'] = self.profile.pk
+        session.save()
+
+    def update(self, durations, state='running'):
+        """Post a live update and return the changed columns of the
+        TimeTrial and the SQL statement types that changed the legs."""
+        url = reverse('timetrial_liveupdate', kwargs={'pk': self.timetrial.pk})
+        data = {
+            'timetrial': self.timetrial.pk,
+            'durations': '\n'.join(str(d) for d in durations),
+            'elapsed_time': str(sum(durations) + 1),
+            'roundtrip_estimate': 0,
+            'state': state,
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'OK')
+        columns = set()
+        legs = []
+        for q in ctx.captured_queries:
+            s = q['sql'].split()
+            set_clause = q['sql'].partition(' SET ')[2].partition(' WHERE ')[0]
+            set_columns = set(re.findall(r'"(\w+)" = ', set_clause))
+            if set_columns == {'revision'}:
+                # The ChangeLog revision, stored after the commit.
+                continue
+            if s[0] == 'UPDATE' and s[1] == '"stopwatch_timetrial"':
+                columns.update(set_columns)
+            elif (s[0] in ('INSERT', 'UPDATE', 'DELETE') and
+                  '"stopwatch_leg"' in s[:3]):
+                legs.append(s[0])
+        return columns, sorted(legs)
+
+    def get_state(self, etag=None):
+        url = reverse('timetrial_live_state',
+                      kwargs={'pk': self.timetrial.pk})
+        if etag is None:
+            return self.client.get(url)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_changed_only(self):
+        summary = {'leg_count', 'duration', 'stop_time', 'last_activity',
+                   'updated_time'}
+        columns, legs = self.update([], 'running')
+        self.assertIn('state', columns)
+        self.assertIn('start_time', columns)
+        self.assertEqual(legs, [])
+
+        # Appending a leg only inserts that leg and updates the summary.
+        columns, legs = self.update([10])
+        self.assertNotIn('state', columns)
+        self.assertLessEqual(columns, summary | {'start_time', 'season'})
+        self.assertEqual(legs, ['INSERT'])
+        start_time = TimeTrial.objects.get(pk=self.timetrial.pk).start_time
+
+        columns, legs = self.update([10, 11])
+        self.assertLessEqual(columns, summary)
+        self.assertEqual(legs, ['INSERT'])
+
+        # An unchanged update writes nothing.
+        self.assertEqual(self.update([10, 11]), (set(), []))
+
+        # Stopping only writes the state.
+        columns, legs = self.update([10, 11], 'stopped')
+        self.assertIn('state', columns)
+        self.assertNotIn('start_time', columns)
+        self.assertNotIn('leg_count', columns)
+        self.assertEqual(legs, [])
+
+        # Changing a leg only updates that leg.
+        columns, legs = self.update([10, 12], 'stopped')
+        self.assertEqual(legs, ['UPDATE'])
+        self.assertIn('start_time', columns)
+        self.assertNotEqual(
+            TimeTrial.objects.get(pk=self.timetrial.pk).start_time,
+            start_time)
+        self.assertEqual(
+            list(self.timetrial.leg_set.order_by('order').values_list(
+                'duration', flat=True)),
+            [10, 12])
+
+    def test_version(self):
+        response = self.get_state()
+        self.assertEqual(response.status_code, 200)
+        etags = [response['ETag']]
+        for durations, state in [([], 'running'), ([10], 'running'),
+                                 ([10, 11], 'running'),
+                                 ([10, 11], 'stopped')]:
+            self.update(durations, state)
+            response = self.get_state()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['durations'], durations)
+            self.assertEqual(response.json()['state'], state)
+            self.assertNotIn(response['ETag'], etags)
+            etags.append(response['ETag'])
+
+    def test_not_modified(self):
+        self.update([10])
+        etag = self.get_state()['ETag']
+        response = self.get_state(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        self.update([10, 11])
+        response = self.get_state(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['durations'], [10, 11])
+        self.assertEqual(self.get_state(response['ETag']).status_code, 304)
+
+    def test_creator_only(self):
+        other = Profile.objects.create(name='Other')
+        session = self.client.session
+        session['kasse_profile_id'] = other.pk
+        session.save()
+        url = reverse('timetrial_liveupdate', kwargs={'pk': self.timetrial.pk})
+        response = self.client.post(url, {
+            'timetrial': self.timetrial.pk, 'durations': '10',
+            'elapsed_time': '11', 'roundtrip_estimate': 0,
+            'state': 'running'})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.timetrial.leg_set.count(), 0)
@@ -0,0 +1,68 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import datetime
+
+from django.http import Http404
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from kasse.models import Profile
+from stopwatch.models import TimeTrial
+from stopwatch.pagination import (
+    encode_cursor, decode_cursor, get_timetrial_page,
+)
+
+
+class CursorTest(SimpleTestCase):
+    def test_round_trip(self):
+        times = [
+            None,
+            datetime.datetime(2016, 1, 16, 8, 15, 30, 123456,
+                              tzinfo=timezone.utc),
+            datetime.datetime(1969, 12, 31, 23, 59, 59, 999999,
+                              tzinfo=timezone.utc),
+            timezone.now(),
+        ]
+        for start_time in times:
+            with self.subTest(start_time=start_time):
+                cursor = encode_cursor(
+                    TimeTrial(pk=42, start_time=start_time))
+                self.assertEqual(decode_cursor(cursor), (start_time, 42))
+
+    def test_invalid(self):
+        for cursor in ['', '_', '1', '1_2_3', 'a_1', '1_a', '1_',
+                       '%d_1' % 10 ** 30]:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(Http404):
+                    decode_cursor(cursor)
+
+
+class TimeTrialPageTest(TestCase):
+    def test_pages(self):
+        profile = Profile.objects.create(name='Test')
+        now = timezone.now()
+        # Some TimeTrials with the same start time and some without.
+        start_times = [now, now, now - datetime.timedelta(seconds=1),
+                       None, now, None, now - datetime.timedelta(days=1)]
+        for start_time in start_times:
+            TimeTrial.objects.create(
+                profile=profile, creator=profile, result='f',
+                start_time=start_time, created_time=now)
+        qs = TimeTrial.objects.all()
+        expected = (
+            list(qs.exclude(start_time=None).order_by('-start_time', '-pk')) +
+            list(qs.filter(start_time=None).order_by('-pk')))
+
+        for size in range(1, len(expected) + 2):
+            with self.subTest(size=size):
+                timetrials = []
+                cursor = None
+                while True:
+                    page = get_timetrial_page(qs, cursor, size=size)
+                    self.assertLessEqual(len(page.object_list), size)
+                    timetrials += page.object_list
+                    if page.next_cursor is None:
+                        break
+                    cursor = page.next_cursor
+                self.assertEqual(timetrials, expected)
@@ -0,0 +1,97 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+from django import forms
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from kasse.forms import ProfileModelChoiceField
+from kasse.models import Profile
+from kasse.versions import bump_version
+
+
+class ProfileForm(forms.Form):
+    profile = ProfileModelChoiceField()
+
+
+class ProfileModelChoiceFieldTest(TestCase):
+    def setUp(self):
+        bump_version('profile_names')
+        self.profile = Profile.objects.create(name='Test')
+        self.other = Profile.objects.create(name='Other')
+
+    def clean(self, value):
+        form = ProfileForm({'profile': value})
+        if form.is_valid():
+            return form.cleaned_data['profile']
+        self.assertEqual(list(form.errors), ['profile'])
+
+    def test_valid(self):
+        self.assertEqual(self.clean(str(self.profile.pk)), self.profile)
+
+    def test_invalid(self):
+        self.assertIsNone(self.clean(''))
+        self.assertIsNone(self.clean('x'))
+        self.assertIsNone(self.clean(str(self.other.pk + 1)))
+
+    def test_deleted(self):
+        pk = self.other.pk
+        self.other.delete()
+        self.assertIsNone(self.clean(str(pk)))
+
+    def test_anonymous(self):
+        anonymous = Profile.objects.create()
+        self.assertIsNone(self.clean(str(anonymous.pk)))
+
+    def test_render(self):
+        bump_version('profile_names')
+        form = ProfileForm(initial={'profile': self.profile.pk})
+        html = str(form['profile'])
+        # Only the selected profile is rendered.
+        self.assertIn('Test', html)
+        self.assertNotIn('Other', html)
+        self.assertIn('data-profile-index="%s?v=' % reverse('profile_json'),
+                      html)
+
+
+class ProfileJsonTest(TransactionTestCase):
+    # The version of the names is bumped when the transaction commits,
+    # so each test commits its changes.
+
+    def setUp(self):
+        bump_version('profile_names')
+        self.profile = Profile.objects.create(name='Test')
+
+    def get(self, **extra):
+        return self.client.get(reverse('profile_json'), **extra)
+
+    def get_labels(self, data):
+        return [label for pk, label in data['profiles']
+                if pk == self.profile.pk]
+
+    def test_rename(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()
+        self.assertEqual(self.get_labels(data), ['Test (independent)'])
+        etag = response['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.profile.name = 'Renamed'
+        self.profile.save()
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        new_data = response.json()
+        self.assertNotEqual(new_data['version'], data['version'])
+        self.assertEqual(self.get_labels(new_data), ['Renamed (independent)'])
+
+    def test_cache_control(self):
+        version = self.get().json()['version']
+        response = self.client.get(reverse('profile_json'), {'v': version})
+        self.assertEqual(response['Cache-Control'], 'max-age=86400')
+        response = self.client.get(reverse('profile_json'),
+                                   {'v': version + 'x'})
+        self.assertEqual(response['Cache-Control'], 'no-cache')
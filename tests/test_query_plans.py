@@ -0,0 +1,18 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+from django.db import connection
+from django.test import TestCase
+
+from stopwatch.management.commands.check_query_plans import hot_queries
+
+
+class QueryPlanTest(TestCase):
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor == 'postgresql':
+            # As in check_query_plans: the test tables are small.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for description, qs, index in hot_queries():
+            with self.subTest(description):
+                self.assertIn(index, qs.explain())
@@ -5,6 +5,11 @@ DEBUG = True
 THUMBNAIL_DEBUG = True
 PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
 FIXTURE_DIRS = [os.path.join(BASE_DIR, 'tests/fixtures/')]
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
 
 for key, handler in LOGGING['handlers'].items():
     if 'filename' in handler:
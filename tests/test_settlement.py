@@ -0,0 +1,88 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import json
+import random
+from decimal import Decimal
+
+from django.test import SimpleTestCase, TestCase
+
+from kasse.models import Association, Profile
+from kasse.names import get_profile_names
+from kasse.versions import bump_version
+from iou.models import ProfileBalance
+from iou.settlement import settle, get_settlement
+
+
+class SettleTest(SimpleTestCase):
+    def apply(self, balances, transfers):
+        """Return the balances after the transfers."""
+        remaining = dict(balances)
+        for t in transfers:
+            self.assertGreater(t.amount, 0)
+            self.assertLess(balances[t.debtor], 0)
+            self.assertGreater(balances[t.creditor], 0)
+            remaining[t.debtor] += t.amount
+            remaining[t.creditor] -= t.amount
+        return remaining
+
+    def test_random(self):
+        rng = random.Random(0)
+        for n in [1, 2, 3, 5, 10, 100, 1000]:
+            with self.subTest(n=n):
+                balances = [(i, Decimal(rng.randrange(-10000, 10000)) / 100)
+                            for i in range(n - 1)]
+                balances.append((n - 1, -sum(b for i, b in balances)))
+                transfers = settle(balances)
+                remaining = self.apply(dict(balances), transfers)
+                self.assertEqual(set(remaining.values()) - {0}, set())
+                self.assertLess(len(transfers), max(n, 1))
+
+    def test_exact_pairs(self):
+        balances = {1: Decimal(-5), 2: Decimal(7), 3: Decimal(-7),
+                    4: Decimal(5), 5: Decimal(-3), 6: Decimal(2),
+                    7: Decimal(1)}
+        transfers = settle(sorted(balances.items()))
+        self.assertEqual(
+            [tuple(t) for t in transfers],
+            [(3, 2, 7), (1, 4, 5), (5, 6, 2), (5, 7, 1)])
+
+    def test_unbalanced(self):
+        balances = {1: Decimal(-10), 2: Decimal(4), 3: Decimal(3)}
+        transfers = settle(sorted(balances.items()))
+        remaining = self.apply(balances, transfers)
+        self.assertEqual(remaining, {1: -3, 2: 0, 3: 0})
+
+
+class GetSettlementTest(TestCase):
+    def test_association(self):
+        association = Association.objects.create(name='Test')
+        inside = [Profile.objects.create(name=name, association=association)
+                  for name in 'AB']
+        outside = Profile.objects.create(name='C')
+        for profile, balance in zip(inside + [outside], [-30, 20, 10]):
+            ProfileBalance.objects.create(profile=profile, balance=balance)
+
+        transfers, unsettled = get_settlement()
+        self.assertEqual(len(transfers), 2)
+        self.assertEqual(unsettled, 0)
+
+        transfers, unsettled = get_settlement(association)
+        self.assertEqual([tuple(t) for t in transfers],
+                         [(inside[0].pk, inside[1].pk, 20)])
+        self.assertEqual(unsettled, -10)
+
+    def test_json_new_profile(self):
+        a = Profile.objects.create(name='A')
+        ProfileBalance.objects.create(profile=a, balance=-10)
+        bump_version('profile_names')
+        get_profile_names()
+        # The names are only recomputed after the commit,
+        # so this process does not know the new profile.
+        b = Profile.objects.create(name='B')
+        self.assertNotIn(b.pk, get_profile_names())
+        ProfileBalance.objects.create(profile=b, balance=10)
+        response = self.client.get('/iou/settle/json/')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf8'))
+        self.assertEqual(data['profiles'], {str(a.pk): 'A', str(b.pk): 'B'})
@@ -0,0 +1,100 @@
+# vim: set fileencoding=utf8:
+from __future__ import absolute_import, unicode_literals, division
+
+import datetime
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from kasse.models import Profile
+from stopwatch.models import TimeTrial, Leg
+
+
+class SetLegsTest(TestCase):
+    def setUp(self):
+        profile = Profile.objects.create(name='Test')
+        self.start_time = timezone.now() - datetime.timedelta(hours=2)
+        self.timetrial = TimeTrial.objects.create(
+            profile=profile, creator=profile, result='f', state='stopped',
+            start_time=self.start_time, created_time=self.start_time)
+
+    def get_legs(self):
+        qs = Leg.objects.filter(timetrial=self.timetrial).order_by('order')
+        return list(qs.values_list(
+            'pk', 'order', 'duration', 'cumulative_duration'))
+
+    def set_legs(self, durations):
+        """Call set_legs and return the SQL statement types that changed
+        the legs."""
+        with CaptureQueriesContext(connection) as ctx:
+            self.timetrial.set_legs(durations)
+        statements = [q['sql'].split() for q in ctx.captured_queries]
+        return sorted(s[0] for s in statements
+                      if s[0] in ('INSERT', 'UPDATE', 'DELETE') and
+                      '"stopwatch_leg"' in s[:3])
+
+    def assertSummary(self, leg_count, duration):
+        timetrial = TimeTrial.objects.get(pk=self.timetrial.pk)
+        self.assertEqual(timetrial.leg_count, leg_count)
+        self.assertEqual(timetrial.duration, duration)
+        if duration is None:
+            self.assertIsNone(timetrial.stop_time)
+        else:
+            self.assertEqual(
+                timetrial.stop_time,
+                self.start_time + datetime.timedelta(seconds=duration))
+
+    def test_diff(self):
+        self.assertEqual(self.set_legs([10, 11]), ['INSERT'])
+        first = self.get_legs()
+        self.assertEqual([leg[1:] for leg in first],
+                         [(1, 10, 10), (2, 11, 21)])
+        self.assertSummary(2, 21)
+
+        # Appending a leg only inserts that leg.
+        self.assertEqual(self.set_legs([10, 11, 12]), ['INSERT'])
+        legs = self.get_legs()
+        self.assertEqual(legs[:2], first)
+        self.assertEqual(legs[2][1:], (3, 12, 33))
+        self.assertSummary(3, 33)
+
+        # Nothing changed.
+        self.assertEqual(self.set_legs([10, 11, 12]), [])
+        self.assertEqual(self.get_legs(), legs)
+
+        # Changing a leg updates it and the cumulative durations after it.
+        self.assertEqual(self.set_legs([10, 13, 12]), ['UPDATE'])
+        changed = self.get_legs()
+        self.assertEqual([leg[0] for leg in changed],
+                         [leg[0] for leg in legs])
+        self.assertEqual([leg[1:] for leg in changed],
+                         [(1, 10, 10), (2, 13, 23), (3, 12, 35)])
+        self.assertSummary(3, 35)
+
+        # Removing legs deletes them and keeps the rest.
+        self.assertEqual(self.set_legs([10]), ['DELETE'])
+        self.assertEqual(self.get_legs(), changed[:1])
+        self.assertSummary(1, 10)
+
+        self.assertEqual(self.set_legs([]), ['DELETE'])
+        self.assertEqual(self.get_legs(), [])
+        self.assertSummary(0, None)
+
+    def test_refresh_legs(self):
+        self.set_legs([10, 11])
+        # Change start_time and a leg without going through set_legs.
+        self.start_time -= datetime.timedelta(hours=1)
+        TimeTrial.objects.filter(pk=self.timetrial.pk).update(
+            start_time=self.start_time)
+        Leg.objects.filter(timetrial=self.timetrial, order=2).update(
+            duration=12)
+        timetrial = TimeTrial.objects.get(pk=self.timetrial.pk)
+        timetrial.refresh_legs()
+        self.assertEqual([leg[1:] for leg in self.get_legs()],
+                         [(1, 10, 10), (2, 12, 22)])
+        self.assertSummary(2, 22)
+        leg = Leg.objects.get(timetrial=self.timetrial, order=2)
+        self.assertEqual(
+            leg.time, self.start_time + datetime.timedelta(seconds=22))